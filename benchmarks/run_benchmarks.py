@@ -0,0 +1,314 @@
+"""
+Benchmark suite for the projection pipeline and lineup optimizer. Generates a
+synthetic dataset with synth_data.py, then times and memory-profiles:
+- each WeeklyStatsYear stage, summed over the seasons
+- the MLDataset split and export
+- the ModelRun steps, including the per-position search
+- player pool pruning and single and multi-lineup optimization
+Wall times are the fastest of --repeat runs. Peak memory is the largest block
+of memory traced by tracemalloc during one extra run of each stage.
+
+The data seed, scale and model grid are fixed by the command line and saved
+with the results, along with the git commit, so result files from different
+commits can be compared with --compare.
+
+Usage:
+    python benchmarks/run_benchmarks.py --players 600 --weeks 17 --out base.json
+    python benchmarks/run_benchmarks.py --compare base.json new.json
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import argparse
+import platform
+import tempfile
+import warnings
+import subprocess
+import tracemalloc
+from contextlib import redirect_stdout
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO, "projection_model"))
+sys.path.insert(0, os.path.join(REPO, "lineup_optimizer"))
+
+import numpy as np
+import pandas as pd
+import synth_data
+import prep_model_data
+import learn_model
+import lineup_optimizer
+
+class globs():
+    REPEAT = 3
+    N_LINEUPS = 20
+
+    # Small fixed grid so model search timings stay comparable between runs
+    grid_params = {
+        "GradBoost": {
+            "n_estimators": [50, 100],
+            "learning_rate": [0.05]
+        }
+    }
+
+    # Steps of WeeklyStatsYear.prep_model_data(), in order
+    year_stages = [
+        ("read_player_data", lambda s: s.read_player_data(s.fpath_player)),
+        ("read_opp_data", lambda s: s.read_opp_data(s.fpath_opp)),
+        ("read_salaries_data", lambda s: s.read_salaries_data(s.fpath_salaries)),
+        ("calc_target_PPR", lambda s: s.calc_target_PPR()),
+        ("calc_ratios", lambda s: s.calc_ratios()),
+        ("clean_positions", lambda s: s.clean_positions()),
+        ("create_nfl_features", lambda s: s.create_nfl_features()),
+        ("merge_salaries", lambda s: s.merge_salaries()),
+        ("read_weather_data", lambda s: s.read_weather_data(s.dir_nflweather)),
+        ("merge_weather", lambda s: s.merge_weather())
+    ]
+
+    # Steps of the MLDataset section of prep_model_data.py's __main__
+    dataset_stages = [
+        ("split_train_val_test", lambda d: d.split_train_val_test()),
+        ("read_espn_benchmark", lambda d: d.read_espn_benchmark(
+            os.path.join(prep_model_data.globs.dir_benchmark, prep_model_data.globs.file_benchmark))),
+        ("trim_low_scores", lambda d: d.trim_low_scores()),
+        ("get_all_features", lambda d: d.get_all_features()),
+        ("export_datasets", lambda d: d.export_datasets())
+    ]
+
+    model_stages = [
+        ("read_data", lambda m: m.read_data(*model_files())),
+        ("prep_data", lambda m: m.prep_data()),
+        ("search_models", lambda m: m.search_models()),
+        ("select_model", lambda m: m.select_model()),
+        ("test_model", lambda m: m.test_model())
+    ]
+
+    position_stages = [
+        ("read_data", lambda m: m.read_data(*model_files())),
+        ("index_positions", lambda m: m.index_positions()),
+        ("fit_positions", lambda m: m.fit_positions()),
+        ("test_model", lambda m: m.test_model())
+    ]
+
+def model_files():
+    d = learn_model.globs.dir_in
+    return (
+        os.path.join(d, learn_model.globs.file_train),
+        os.path.join(d, learn_model.globs.file_val),
+        os.path.join(d, learn_model.globs.file_test)
+    )
+
+def point_globs(data_dir, model_dir, years):
+    """Point the pipeline scripts' globs at the synthetic dataset."""
+    g = prep_model_data.globs
+    g.dir_player = os.path.join(data_dir, "player_weeks")
+    g.dir_opp = os.path.join(data_dir, "opp_weeks")
+    g.dir_salaries = os.path.join(data_dir, "fanduel_salaries")
+    g.dir_nflweather = os.path.join(data_dir, "nfl_weather")
+    g.dir_benchmark = os.path.join(data_dir, "espn_projections")
+    g.dir_model = model_dir
+    g.file_team_rename_map = os.path.join(data_dir, "meta_data", "team_rename_map.csv")
+    g.file_weather_rename_map = os.path.join(data_dir, "meta_data", "weather_team_rename_map.csv")
+    g.file_benchmark = "espn_proj_{}.csv".format(years[-1])
+    g.YEARS = list(years)
+    g.TRAIN_YRS = list(years[:-2])
+    g.VAL_YRS = [years[-2]]
+    g.TEST_YRS = [years[-1]]
+    learn_model.globs.dir_in = model_dir
+    learn_model.globs.grid_params = globs.grid_params
+
+def new_stats_year(year):
+    g = prep_model_data.globs
+    return prep_model_data.WeeklyStatsYear(
+        year,
+        os.path.join(g.dir_player, g.file_player.format(year)),
+        os.path.join(g.dir_opp, g.file_opp.format(year)),
+        os.path.join(g.dir_salaries, g.file_salaries.format(year)),
+        os.path.join(g.dir_snapcounts, g.file_snapcounts.format(year)),
+        g.dir_nflweather
+    )
+
+def run_stages(obj, stages, memory):
+    """
+    Run each stage on obj in order. Returns {stage: seconds} or, with memory,
+    {stage: peak traced MB}.
+    """
+    results = {}
+    for name, stage in stages:
+        if memory:
+            tracemalloc.start()
+            stage(obj)
+            results[name] = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+        else:
+            start = time.perf_counter()
+            stage(obj)
+            results[name] = time.perf_counter() - start
+    return results
+
+def bench(prefix, make_obj, stages, repeat, memory, combine=sum):
+    """
+    Time the stages repeat times on fresh objects from make_obj(), which returns
+    a list of objects (e.g. one per season) whose stage results are combined.
+    Returns ({prefix.stage: {"wall_s", "peak_mb"}}, the objects from the last run).
+    """
+    walls = {}
+    for _ in range(repeat):
+        objs = make_obj()
+        runs = [run_stages(obj, stages, memory=False) for obj in objs]
+        for name, _ in stages:
+            wall = combine(run[name] for run in runs)
+            walls[name] = min(wall, walls.get(name, np.inf))
+    peaks = {}
+    if memory:
+        objs = make_obj()
+        runs = [run_stages(obj, stages, memory=True) for obj in objs]
+        peaks = {name: max(run[name] for run in runs) for name, _ in stages}
+    results = {}
+    for name, _ in stages:
+        results["{}.{}".format(prefix, name)] = {"wall_s": walls[name], "peak_mb": peaks.get(name)}
+    return results, objs
+
+def slate_pool(data_dir, year):
+    """Player pool for the last week of a season, projected at their actual FanDuel points."""
+    df = pd.read_csv(os.path.join(data_dir, "fanduel_salaries", "fd_salaries_{}.csv".format(year)))
+    df = df[df.Week == df.Week.max()]
+    return pd.DataFrame({
+        "full_name": df.LastName.str.strip() + " " + df.FirstName.str.strip(),
+        "team": df.Team.str.upper(),
+        "position": df.Pos,
+        "fd_salary": df.fd_salary,
+        "proj": df.fd_points
+    }).reset_index(drop=True)
+
+def run(args):
+    """Run every benchmark. The synthetic data goes to args.data_dir, or to a temp dir removed afterwards."""
+    if args.data_dir:
+        return run_in(args, args.data_dir)
+    with tempfile.TemporaryDirectory(prefix="nfl_bench_") as data_dir:
+        return run_in(args, data_dir)
+
+def run_in(args, data_dir):
+    model_dir = os.path.join(data_dir, "model_data")
+    os.makedirs(model_dir, exist_ok=True)
+    years = list(range(2019 - args.seasons + 1, 2020))
+
+    start = time.perf_counter()
+    synth_data.generate(data_dir, args.players, args.weeks, years, args.seed)
+    results = {"synth_data.generate": {"wall_s": time.perf_counter() - start, "peak_mb": None}}
+    point_globs(data_dir, model_dir, years)
+
+    def make_years():
+        return [new_stats_year(year) for year in years]
+    res, stats_yrs = bench("WeeklyStatsYear", make_years, globs.year_stages, args.repeat, args.memory)
+    results.update(res)
+
+    g = prep_model_data.globs
+    def make_dataset():
+        return [prep_model_data.MLDataset(stats_yrs, "all", g.TRAIN_YRS, g.VAL_YRS, g.TEST_YRS)]
+    res, _ = bench("MLDataset", make_dataset, globs.dataset_stages, args.repeat, args.memory)
+    results.update(res)
+
+    if not args.skip_model:
+        res, _ = bench("ModelRun", lambda: [learn_model.ModelRun()],
+                       globs.model_stages, args.repeat, args.memory)
+        results.update(res)
+        res, _ = bench("PositionModelRun", lambda: [learn_model.PositionModelRun()],
+                       globs.position_stages, args.repeat, args.memory)
+        results.update(res)
+
+    pool = slate_pool(data_dir, years[-1])
+    lineup_stages = [
+        ("prune_pool", lambda p: lineup_optimizer.prune_pool(p)),
+        ("optimize_lineup_unpruned", lambda p: lineup_optimizer.optimize_lineup(p, prune=False)),
+        ("optimize_lineup", lambda p: lineup_optimizer.optimize_lineup(p)),
+        ("optimize_lineups", lambda p: lineup_optimizer.optimize_lineups(p, globs.N_LINEUPS, seed=args.seed))
+    ]
+    res, _ = bench("lineup_optimizer", lambda: [pool], lineup_stages, args.repeat, args.memory)
+    results.update(res)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "players": args.players,
+            "weeks": args.weeks,
+            "seasons": args.seasons,
+            "slate_players": len(pool),
+            "prune_reduction": lineup_optimizer.prune_pool(pool)[1],
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "grid_params": globs.grid_params,
+            "n_lineups": globs.N_LINEUPS
+        },
+        "stages": results
+    }
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(results):
+    print("{:<45} {:>10} {:>10}".format("stage", "wall_s", "peak_mb"))
+    for name, res in results["stages"].items():
+        peak = "" if res["peak_mb"] is None else "{:.1f}".format(res["peak_mb"])
+        print("{:<45} {:>10.4f} {:>10}".format(name, res["wall_s"], peak))
+
+def print_compare(base, new):
+    """Print the wall time and peak memory ratio (new / base) of every stage in both files."""
+    for key in ["players", "weeks", "seasons", "seed", "grid_params"]:
+        if base["meta"].get(key) != new["meta"].get(key):
+            print("Warning: runs differ in {}: {} vs {}".format(key, base["meta"].get(key), new["meta"].get(key)))
+    print("{} -> {}".format(base["meta"].get("commit"), new["meta"].get("commit")))
+    print("{:<45} {:>10} {:>10} {:>8} {:>8}".format("stage", "base_s", "new_s", "time_x", "mem_x"))
+    for name, res in new["stages"].items():
+        if name not in base["stages"]:
+            continue
+        b = base["stages"][name]
+        time_x = res["wall_s"] / b["wall_s"] if b["wall_s"] else np.nan
+        mem_x = res["peak_mb"] / b["peak_mb"] if res["peak_mb"] and b["peak_mb"] else np.nan
+        print("{:<45} {:>10.4f} {:>10.4f} {:>8.2f} {:>8.2f}".format(name, b["wall_s"], res["wall_s"], time_x, mem_x))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic data.")
+    parser.add_argument("--players", type=int, default=600, help="players per season")
+    parser.add_argument("--weeks", type=int, default=17, help="weeks per season")
+    parser.add_argument("--seasons", type=int, default=4, help="seasons ending in 2019 (at least 3)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=globs.REPEAT)
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip the tracemalloc run")
+    parser.add_argument("--skip-model", action="store_true", help="skip the ModelRun stages")
+    parser.add_argument("--data-dir", help="where to write the synthetic data (default: a temp dir)")
+    parser.add_argument("--out", help="write results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's own output")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        print_compare(base, new)
+        sys.exit(0)
+
+    if args.seasons < 3:
+        parser.error("--seasons must be at least 3 (train, val and test)")
+    if args.verbose:
+        results = run(args)
+    else:
+        warnings.simplefilter("ignore")
+        with redirect_stdout(io.StringIO()):
+            results = run(args)
+    print_results(results)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,244 @@
+"""
+Synthetic season generator for benchmarking the pipeline. Writes inputs with
+the same layout and columns that prep_model_data.py reads:
+- player_weeks/player_stats_{year}.csv
+- opp_weeks/opp_stats_{year}.csv
+- fanduel_salaries/fd_salaries_{year}.csv
+- nfl_weather/{year}_{week}.csv
+- espn_projections/espn_proj_{year}.csv (last year only)
+- meta_data/team_rename_map.csv, meta_data/weather_team_rename_map.csv
+The values are random but the same seed always produces the same files, so
+runs at the same scale are comparable across commits.
+"""
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+class globs():
+    N_TEAMS = 32
+    POSITIONS = ["QB", "RB", "WR", "TE"]
+    POSITION_SHARE = [0.15, 0.30, 0.35, 0.20]
+    MISSING_POSITION = 0.01 # Share of player-weeks with a blank position
+
+    WIND_DIRS = ["N", "NNE", "NE", "E", "SE", "S", "SW", "W", "WSW", "NW"]
+    FORECASTS = ["Clear", "Partly Cloudy", "Overcast", "Rain", "Snow", "DOME"]
+
+    # Mean weekly stat lines by position, scaled per player by a talent factor
+    stat_means = {
+        "QB": {"passing_att": 34, "passing_cmp": 22, "passing_yds": 250, "passing_tds": 1.6,
+               "passing_ints": 0.8, "rushing_att": 3, "rushing_yds": 14, "rushing_tds": 0.1},
+        "RB": {"rushing_att": 12, "rushing_yds": 52, "rushing_tds": 0.35, "receiving_rec": 2.5,
+               "receiving_yds": 20, "receiving_tds": 0.1},
+        "WR": {"receiving_rec": 4, "receiving_yds": 55, "receiving_tds": 0.35, "rushing_att": 0.2,
+               "rushing_yds": 1.5},
+        "TE": {"receiving_rec": 3, "receiving_yds": 35, "receiving_tds": 0.25}
+    }
+
+    # Raw (not derived) player stat columns read by prep_model_data.py
+    count_stats = [
+        "passing_att", "passing_cmp", "passing_yds", "passing_tds", "passing_ints",
+        "passing_twopta", "passing_twoptm", "rushing_att", "rushing_yds", "rushing_tds",
+        "rushing_lng", "rushing_lngtd", "rushing_twopta", "rushing_twoptm",
+        "receiving_rec", "receiving_yds", "receiving_tds", "receiving_lng", "receiving_lngtd",
+        "receiving_twopta", "receiving_twoptm", "fumbles_lost", "fumbles_rcv", "fumbles_tot",
+        "fumbles_trcv", "fumbles_yds", "puntret_tds", "puntret_avg", "puntret_lng",
+        "puntret_lngtd", "puntret_ret", "kickret_tds"
+    ]
+
+    opp_stats = [
+        "opp_opp_points", "opp_first_downs", "opp_total_yds", "opp_passing_yds",
+        "opp_rushing_yds", "opp_penalty_yds", "opp_penalty_cnt", "opp_turnovers",
+        "opp_punt_cnt", "opp_punt_yds", "opp_punt_avg", "opp_pos_time"
+    ]
+
+def team_codes(n_teams=globs.N_TEAMS):
+    return ["T{:02d}".format(i) for i in range(n_teams)]
+
+def make_players(n_players, rng):
+    """One row of static attributes per player."""
+    teams = team_codes()
+    ids = ["00-{:07d}".format(i) for i in range(n_players)]
+    first = ["First{}".format(i) for i in range(n_players)]
+    last = ["Last{}".format(i) for i in range(n_players)]
+    return pd.DataFrame({
+        "id": ids,
+        "name": [f + " " + l for f, l in zip(first, last)],
+        "first_name": first,
+        "last_name": last,
+        "team": rng.choice(teams, n_players),
+        "position": rng.choice(globs.POSITIONS, n_players, p=globs.POSITION_SHARE),
+        "birthdate": pd.to_datetime("1985-01-01") + pd.to_timedelta(rng.integers(0, 5000, n_players), unit="D"),
+        "years_pro": rng.integers(1, 15, n_players),
+        "height": rng.integers(68, 78, n_players),
+        "weight": rng.integers(180, 250, n_players),
+        "number": rng.integers(1, 99, n_players),
+        "talent": rng.lognormal(0, 0.4, n_players)
+    })
+
+def make_schedule(n_weeks, rng):
+    """Random pairings of every team for each week, as (week, home, away) rows."""
+    teams = np.array(team_codes())
+    rows = []
+    for week in range(1, n_weeks+1):
+        order = rng.permutation(teams)
+        for home, away in zip(order[0::2], order[1::2]):
+            rows.append((week, home, away))
+    return pd.DataFrame(rows, columns=["week", "home", "away"])
+
+def make_player_stats(players, schedule, year, rng):
+    """Weekly stat lines for every player, with the opponent taken from the schedule."""
+    weeks = sorted(schedule.week.unique())
+    df = players.loc[players.index.repeat(len(weeks))].reset_index(drop=True)
+    df["week"] = np.tile(weeks, len(players))
+    n = len(df)
+    for col in globs.count_stats:
+        df[col] = 0.0
+    talent = df["talent"].to_numpy()
+    for pos, means in globs.stat_means.items():
+        mask = (df["position"] == pos).to_numpy()
+        for col, mean in means.items():
+            df.loc[mask, col] = rng.poisson(mean * talent[mask]).astype(float)
+    df["passing_cmp"] = np.minimum(df["passing_cmp"], df["passing_att"])
+    df["rushing_lng"] = np.minimum(df["rushing_yds"], rng.integers(0, 40, n))
+    df["receiving_lng"] = np.minimum(df["receiving_yds"], rng.integers(0, 50, n))
+    df["fumbles_tot"] = rng.poisson(0.1, n).astype(float)
+    df["fumbles_lost"] = np.minimum(df["fumbles_tot"], rng.poisson(0.05, n))
+    blank = rng.random(n) < globs.MISSING_POSITION
+    df.loc[blank, "position"] = np.nan
+    df["year"] = year
+    df["profile_url"] = "http://www.nfl.com/player/" + df["id"]
+    df["birthdate"] = df["birthdate"].dt.strftime("%m/%d/%Y")
+    cols = ["id", "week", "year", "team", "position", "name", "birthdate", "years_pro",
+            "height", "weight", "profile_url", "last_name", "number"] + globs.count_stats
+    return df[cols]
+
+def make_opp_stats(schedule, rng):
+    """Team box score rows, one for each side of every game."""
+    home = schedule.rename(columns={"home": "opp_TEAM", "away": "opp_OPP"})
+    away = schedule.rename(columns={"away": "opp_TEAM", "home": "opp_OPP"})
+    df = pd.concat([home, away]).rename(columns={"week": "opp_week"}).reset_index(drop=True)
+    n = len(df)
+    df["opp_opp_points"] = rng.poisson(22, n)
+    df["opp_first_downs"] = rng.poisson(20, n)
+    df["opp_passing_yds"] = rng.poisson(240, n)
+    df["opp_rushing_yds"] = rng.poisson(110, n)
+    df["opp_total_yds"] = df["opp_passing_yds"] + df["opp_rushing_yds"]
+    df["opp_penalty_cnt"] = rng.poisson(6, n)
+    df["opp_penalty_yds"] = df["opp_penalty_cnt"] * 8
+    df["opp_turnovers"] = rng.poisson(1.3, n)
+    df["opp_punt_cnt"] = rng.poisson(4, n)
+    df["opp_punt_yds"] = df["opp_punt_cnt"] * 45
+    df["opp_punt_avg"] = 45.0
+    df["opp_pos_time"] = rng.integers(1500, 2100, n)
+    return df[["opp_week", "opp_TEAM", "opp_OPP"] + globs.opp_stats]
+
+def make_salaries(player_stats, players, schedule, year, rng):
+    """
+    FanDuel salary rows in the rotoguru layout. Like the scraped files, the
+    FirstName column holds the last name and LastName the first name.
+    """
+    df = player_stats[player_stats.position.notna()].merge(
+        players[["id", "first_name", "talent"]], on="id")
+    games = pd.concat([
+        schedule.rename(columns={"home": "team", "away": "opp"}).assign(ha="h"),
+        schedule.rename(columns={"away": "team", "home": "opp"}).assign(ha="a")
+    ])
+    df = df.merge(games, on=["week", "team"], how="left")
+    fd_points = (df.passing_tds*4 + df.passing_yds*0.04 - df.passing_ints + df.rushing_tds*6 +
+                 df.rushing_yds*0.1 + df.receiving_tds*6 + df.receiving_yds*0.1 +
+                 df.receiving_rec*0.5 - df.fumbles_lost*2)
+    salary = 4500 + np.clip(df.talent.to_numpy(), 0, 2.5) * 1800 + rng.normal(0, 300, len(df))
+    return pd.DataFrame({
+        "Week": df.week,
+        "Year": year,
+        "GID": df.id.str[3:].astype(int),
+        "FirstName": df.last_name,
+        "LastName": " " + df.first_name,
+        "Pos": df.position,
+        "Team": df.team.str.lower(),
+        "h/a": df.ha,
+        "Oppt": df.opp.str.lower(),
+        "fd_points": fd_points.round(2),
+        "fd_salary": (np.clip(salary, 4500, 10000) // 100 * 100).astype(int)
+    })
+
+def make_weather(schedule, week, rng):
+    """Weather rows for one week, using team nicknames like the nfl_weather files."""
+    games = schedule[schedule.week == week]
+    n = len(games)
+    forecasts = rng.choice(globs.FORECASTS, n)
+    temps = rng.integers(20, 90, n)
+    return pd.DataFrame({
+        "team1": "Team" + games.home.str[1:],
+        "team2": "Team" + games.away.str[1:],
+        "wind_conditions": ["{}m {}".format(w, d) for w, d in
+                            zip(rng.integers(0, 25, n), rng.choice(globs.WIND_DIRS, n))],
+        "weather_forecast": ["{}f {}".format(t, f) if f != "DOME" else "DOME"
+                             for t, f in zip(temps, forecasts)]
+    })
+
+def make_benchmark(salaries, rng):
+    """ESPN-style PPR projections for every salaried player-week."""
+    return pd.DataFrame({
+        "Week": salaries.Week,
+        "year": salaries.Year,
+        "Name": salaries.LastName.str.strip() + " " + salaries.FirstName,
+        "Pos": salaries.Pos,
+        "proj_espn_ppr": (salaries.fd_points + rng.normal(0, 5, len(salaries))).round(2)
+    })
+
+def make_rename_maps(out_dir):
+    """Team rename maps read by prep_model_data.RenameMap."""
+    teams = team_codes()
+    os.makedirs(os.path.join(out_dir, "meta_data"), exist_ok=True)
+    pd.DataFrame({"from": teams, "to": teams}).to_csv(
+        os.path.join(out_dir, "meta_data", "team_rename_map.csv"), index=False)
+    pd.DataFrame({"from": ["Team" + t[1:] for t in teams], "to": teams}).to_csv(
+        os.path.join(out_dir, "meta_data", "weather_team_rename_map.csv"), index=False)
+
+def generate(out_dir, n_players=600, n_weeks=17, years=(2016, 2017, 2018, 2019), seed=0):
+    """
+    Write a synthetic dataset of n_players x n_weeks x len(years) player-weeks
+    under out_dir. Returns the paths of the directories written.
+    """
+    rng = np.random.default_rng(seed)
+    dirs = {
+        "player": os.path.join(out_dir, "player_weeks"),
+        "opp": os.path.join(out_dir, "opp_weeks"),
+        "salaries": os.path.join(out_dir, "fanduel_salaries"),
+        "nflweather": os.path.join(out_dir, "nfl_weather"),
+        "benchmark": os.path.join(out_dir, "espn_projections"),
+        "meta": os.path.join(out_dir, "meta_data")
+    }
+    for d in dirs.values():
+        os.makedirs(d, exist_ok=True)
+    make_rename_maps(out_dir)
+
+    players = make_players(n_players, rng)
+    for year in years:
+        schedule = make_schedule(n_weeks, rng)
+        player_stats = make_player_stats(players, schedule, year, rng)
+        player_stats.to_csv(os.path.join(dirs["player"], "player_stats_{}.csv".format(year)), index=False)
+        make_opp_stats(schedule, rng).to_csv(
+            os.path.join(dirs["opp"], "opp_stats_{}.csv".format(year)), index=False)
+        salaries = make_salaries(player_stats, players, schedule, year, rng)
+        salaries.to_csv(os.path.join(dirs["salaries"], "fd_salaries_{}.csv".format(year)), index=False)
+        for week in range(1, n_weeks+1):
+            make_weather(schedule, week, rng).to_csv(
+                os.path.join(dirs["nflweather"], "{}_{}.csv".format(year, week)), index=False)
+        if year == years[-1]:
+            make_benchmark(salaries, rng).to_csv(
+                os.path.join(dirs["benchmark"], "espn_proj_{}.csv".format(year)), index=False)
+    return dirs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic NFL dataset.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--players", type=int, default=600)
+    parser.add_argument("--weeks", type=int, default=17)
+    parser.add_argument("--years", type=int, nargs="+", default=[2016, 2017, 2018, 2019])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate(args.out_dir, args.players, args.weeks, args.years, args.seed)
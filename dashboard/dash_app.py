@@ -0,0 +1,212 @@
+"""
+Bokeh server app for the DFS dashboard: average points per position, points
+vs salary, Top 5 players and team totals, plus average points by week.
+Every view is drawn from the DashCube in dash_data.py. Filter changes slice
+the cube. When the data files change, the cube is rebuilt once, new weeks are
+streamed to the weekly points chart and the other views are re-sliced.
+
+Usage (from the repository root):
+    bokeh serve --show dashboard/dash_app.py
+"""
+
+import os
+import sys
+from math import pi
+
+import numpy as np
+from bokeh.io import curdoc
+from bokeh.layouts import column, row
+from bokeh.models import (CheckboxButtonGroup, ColorBar, ColumnDataSource, HoverTool, LinearColorMapper,
+                          MultiChoice, NumeralTickFormatter, RangeSlider, Select, TabPanel, Tabs)
+from bokeh.palettes import Viridis, Viridis256
+from bokeh.plotting import figure
+from bokeh.transform import cumsum, transform
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import dash_data
+
+class globs():
+    REFRESH_MS = 60000 # How often the data files are checked for changes
+    TOP_N = 5
+    TOP_STATS = {"Passing TD": "PassingTD", "Interceptions": "Int", "Fumbles": "FL",
+                 "Rushing Yds": "RushingYds", "Receiving Yds": "ReceivingYds", "PPR Points": "PPRFantasyPoints"}
+    TEAM_STATS = {"Completions": "Cmp", "Passing Yds": "PassingYds", "Rushing Yds": "RushingYds",
+                  "Receiving Yds": "ReceivingYds", "Receptions": "Rec", "PPR Points": "PPRFantasyPoints"}
+    TITLE_STYLE = {"text_font_size": "20px", "align": "center", "text_color": "#4D5656"}
+
+def style_title(p):
+    for key, value in globs.TITLE_STYLE.items():
+        setattr(p.title, key, value)
+
+class Dashboard():
+    def __init__(self, doc):
+        self.doc = doc
+        self.cube = dash_data.load_cube()
+
+        cube = self.cube
+        self.seasons = MultiChoice(title="Seasons", options=[str(y) for y in cube.years],
+                                   value=[str(cube.years[-1])])
+        self.weeks = RangeSlider(title="Weeks", start=cube.weeks[0], end=cube.weeks[-1], step=1,
+                                 value=(cube.weeks[0], cube.weeks[-1]))
+        self.teams = MultiChoice(title="Teams (all when empty)", options=cube.teams, value=[])
+        self.positions = CheckboxButtonGroup(labels=cube.positions, active=list(range(len(cube.positions))))
+        self.top_stat = Select(title="Top 5", options=list(globs.TOP_STATS), value="Passing TD")
+        self.team_stat = Select(title="Team total", options=list(globs.TEAM_STATS), value="Completions")
+
+        self.pie_source = ColumnDataSource(data=dict(Pos=[], value=[], angle=[], color=[]))
+        self.scatter_source = ColumnDataSource(data=dict(Name=[], Team=[], Pos=[], fd_points=[], fd_salary=[], Weeks=[]))
+        self.top_source = ColumnDataSource(data=dict(Name=[], value=[], color=[]))
+        self.team_source = ColumnDataSource(data=dict(Team=[], value=[], color=[]))
+        self.trend_source = ColumnDataSource(data=dict(x=[], period=[], value=[]))
+
+        self.figures = self.make_figures()
+        for widget in [self.seasons, self.teams]:
+            widget.on_change("value", lambda attr, old, new: self.update())
+        self.weeks.on_change("value_throttled", lambda attr, old, new: self.update())
+        self.positions.on_change("active", lambda attr, old, new: self.update())
+        self.top_stat.on_change("value", lambda attr, old, new: self.update_top())
+        self.team_stat.on_change("value", lambda attr, old, new: self.update_teams())
+
+        self.update()
+        doc.add_periodic_callback(self.refresh, globs.REFRESH_MS)
+
+    def filters(self):
+        return {
+            "years": [int(y) for y in self.seasons.value],
+            "weeks": self.weeks.value,
+            "teams": self.teams.value or None,
+            "positions": [self.cube.positions[i] for i in self.positions.active]
+        }
+
+    def make_figures(self):
+        p_pie = figure(title="AVG POINTS PER POSITION", height=400, width=450, x_range=(-0.5, 1.0),
+                       tools="hover,save,reset", tooltips="@Pos: @value{0.00}")
+        p_pie.wedge(x=0, y=1, radius=0.4, start_angle=cumsum("angle", include_zero=True),
+                    end_angle=cumsum("angle"), line_color="white", fill_color="color",
+                    legend_field="Pos", source=self.pie_source)
+        p_pie.axis.visible = False
+        p_pie.grid.grid_line_color = None
+
+        color_mapper = LinearColorMapper(palette=Viridis256, low=3500, high=10000)
+        p_scatter = figure(title="POINTS AND SALARY RELATION", height=400, sizing_mode="stretch_width",
+                           x_axis_label="Avg Salary", y_axis_label="Avg Points",
+                           tools="save,reset,wheel_zoom,pan")
+        p_scatter.add_tools(HoverTool(tooltips=[("Player", "@Name"), ("Team", "@Team"), ("Weeks", "@Weeks"),
+                                                ("Points", "@fd_points{0.0}"), ("Salary", "$@fd_salary{0}")]))
+        p_scatter.scatter(x="fd_salary", y="fd_points", size=10, alpha=0.6,
+                          color=transform("fd_salary", color_mapper), source=self.scatter_source)
+        p_scatter.xaxis[0].formatter = NumeralTickFormatter(format="$0")
+        p_scatter.add_layout(ColorBar(color_mapper=color_mapper, label_standoff=15, title="Salary"), "right")
+
+        p_top = figure(title="TOP 5", y_range=[], height=400, sizing_mode="stretch_width",
+                       tools="hover,save,reset", tooltips="@Name: @value")
+        p_top.hbar(y="Name", right="value", height=0.4, fill_color="color", alpha=0.8, source=self.top_source)
+        p_top.xgrid.grid_line_color = None
+
+        p_team = figure(title="TEAM TOTALS", x_range=[], height=400, sizing_mode="stretch_width",
+                        tools="hover,save,reset", tooltips="@Team: @value")
+        p_team.scatter(x="Team", y="value", size=20, fill_color="color", line_color=None, alpha=0.8,
+                       source=self.team_source)
+        p_team.xaxis.major_label_orientation = pi / 4
+
+        p_trend = figure(title="AVG POINTS BY WEEK", height=300, sizing_mode="stretch_width",
+                         x_axis_label="Season", tools="hover,save,reset", tooltips="@period: @value{0.00}")
+        p_trend.line(x="x", y="value", line_width=2, source=self.trend_source)
+        p_trend.scatter(x="x", y="value", size=6, source=self.trend_source)
+
+        for p in [p_pie, p_scatter, p_top, p_team, p_trend]:
+            style_title(p)
+        return {"pie": p_pie, "scatter": p_scatter, "top": p_top, "team": p_team, "trend": p_trend}
+
+    def layout(self):
+        f = self.figures
+        controls = row(self.seasons, self.weeks, self.teams, self.positions, sizing_mode="stretch_width")
+        tabs = Tabs(tabs=[
+            TabPanel(child=row(f["pie"], f["scatter"], sizing_mode="stretch_width"), title="Points and Salary"),
+            TabPanel(child=column(self.top_stat, f["top"], sizing_mode="stretch_width"), title="Top 5"),
+            TabPanel(child=column(self.team_stat, f["team"], sizing_mode="stretch_width"), title="Teams")
+        ], sizing_mode="stretch_width")
+        return column(controls, tabs, f["trend"], sizing_mode="stretch_width")
+
+    def update(self):
+        self.update_pie()
+        self.update_scatter()
+        self.update_top()
+        self.update_teams()
+        self.update_trend()
+
+    def update_pie(self):
+        df = self.cube.avg_points_by_position(**self.filters())
+        total = df.value.sum()
+        self.pie_source.data = {
+            "Pos": list(df.index),
+            "value": df.value.to_numpy(),
+            "angle": (df.value / total * 2*pi).to_numpy() if total > 0 else np.zeros(len(df)),
+            "color": list(Viridis[4][:len(df)])
+        }
+
+    def update_scatter(self):
+        df = self.cube.points_vs_salary(**self.filters()).reset_index()
+        self.scatter_source.data = {col: df[col].to_numpy() for col in self.scatter_source.data}
+
+    def update_top(self):
+        df = self.cube.top_players(globs.TOP_STATS[self.top_stat.value], globs.TOP_N, **self.filters())
+        names = list(df.index)
+        self.figures["top"].y_range.factors = names[::-1]
+        self.figures["top"].title.text = "TOP 5: {}".format(self.top_stat.value.upper())
+        self.top_source.data = {"Name": names, "value": df.iloc[:, 0].to_numpy(),
+                                "color": list(Viridis[5][:len(names)])}
+
+    def update_teams(self):
+        df = self.cube.team_totals(globs.TEAM_STATS[self.team_stat.value], **self.filters())
+        teams = list(df.index)
+        self.figures["team"].x_range.factors = teams
+        self.figures["team"].title.text = "TEAM {}".format(self.team_stat.value.upper())
+        colors = [Viridis256[i] for i in np.linspace(0, 255, max(len(teams), 1)).astype(int)][:len(teams)]
+        self.team_source.data = {"Team": teams, "value": df.iloc[:, 0].to_numpy(), "color": colors}
+
+    def trend_data(self):
+        df = self.cube.weekly_points(**self.filters())
+        weeks = self.cube.weeks
+        return {"x": (df.Year + (df.Week - weeks[0]) / (weeks[-1] - weeks[0] + 1)).to_numpy(),
+                "period": df.period.tolist(), "value": df.value.to_numpy()}
+
+    def update_trend(self):
+        self.trend_source.data = self.trend_data()
+
+    def refresh(self):
+        """
+        Pick up changed data files. If the weekly points shown so far are
+        unchanged, only the new weeks are streamed; otherwise the chart is
+        replaced. The other views are re-sliced from the new cube.
+        """
+        cube = dash_data.load_cube()
+        if cube is self.cube:
+            return
+        self.cube = cube
+        self.seasons.options = [str(y) for y in cube.years]
+        self.teams.options = cube.teams
+        # Keep a full-range week filter full when the data gains weeks (e.g. an 18-week season)
+        full = tuple(self.weeks.value) == (self.weeks.start, self.weeks.end)
+        self.weeks.start, self.weeks.end = cube.weeks[0], cube.weeks[-1]
+        if full:
+            self.weeks.value = (cube.weeks[0], cube.weeks[-1])
+
+        new = self.trend_data()
+        old = self.trend_source.data
+        n_old = len(old["period"])
+        # A longer weeks axis moves every x, so the chart is then replaced too
+        if list(old["period"]) == new["period"][:n_old] and np.allclose(old["value"], new["value"][:n_old]) \
+                and np.allclose(old["x"], new["x"][:n_old]):
+            if len(new["period"]) > n_old:
+                self.trend_source.stream({key: list(values[n_old:]) for key, values in new.items()})
+        else:
+            self.trend_source.data = new
+        self.update_pie()
+        self.update_scatter()
+        self.update_top()
+        self.update_teams()
+
+dashboard = Dashboard(curdoc())
+curdoc().add_root(dashboard.layout())
+curdoc().title = "Fantasy NFL Dashboard"
@@ -0,0 +1,196 @@
+"""
+Dashboard backend. Reads the weekly player stats and FanDuel salary files once
+per data refresh and aggregates them into:
+- a cube of sums indexed by season x week x team x position, one array per
+  measure, for the pie and team views.
+- a player table of sums indexed by player x season x week, for the points vs
+  salary and Top 5 views.
+Dashboard filters (seasons, week range, teams, positions) are applied by
+slicing these arrays, so no view goes back to the raw rows after a refresh.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "data")
+
+class globs():
+    file_weekly = os.path.join(DATA_DIR, "dash_sample_weekly_2019.csv")
+    file_salaries = os.path.join(DATA_DIR, "dash_fd_salaries_2019.csv")
+
+    POSITIONS = ["QB", "RB", "WR", "TE"]
+    STATS = ["PassingTD", "Int", "FL", "Cmp", "PassingYds", "RushingYds", "ReceivingYds", "Rec", "PPRFantasyPoints"]
+    SALARY_STATS = ["fd_points", "fd_salary"]
+    # Salary files use different codes for a few teams
+    TEAM_RENAME = {"JAC": "JAX"}
+
+def read_weekly(path=globs.file_weekly):
+    df = pd.read_csv(path).dropna()
+    df = df[df.Pos.isin(globs.POSITIONS)]
+    return df.rename(columns={"Player": "Name"})
+
+def read_salaries(path=globs.file_salaries):
+    """Salary rows cleaned as in fd_salaries_2019.ipynb (no zero salaries, negative points or NaNs)."""
+    df = pd.read_csv(path)
+    df = df[pd.to_numeric(df.Week, errors="coerce").notna()] # Drops repeated header rows
+    for col in ["Week", "Year", "fd_points", "fd_salary"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    df = df[(df.fd_salary != 0) & (df.fd_points >= 0) & df.Pos.isin(globs.POSITIONS)].dropna()
+    df["Name"] = (df.LastName.str.strip() + " " + df.FirstName.str.strip())
+    df["Team"] = df.Team.str.upper().replace(globs.TEAM_RENAME)
+    return df
+
+def _group_sums(df, keys, stats, count_col):
+    g = df.groupby(keys)
+    sums = g[stats].sum()
+    sums[count_col] = g.size()
+    return sums
+
+class DashCube():
+    """
+    Aggregates for the dashboard. cube[measure] has shape
+    (seasons, weeks, teams, positions) and players[measure] has shape
+    (players, seasons, weeks). The weeks axis holds every week number found
+    in either file, so seasons of 17 and 18 weeks share it. Players are
+    filtered by their most recent team and position. Counts of weekly stat
+    rows and salary rows are kept as the measures "n" and "n_salary" so means
+    can be taken after summing a slice.
+    """
+    def __init__(self, df_weekly, df_salaries):
+        self.years = sorted(set(df_weekly.Year) | set(df_salaries.Year))
+        self.weeks = sorted(set(df_weekly.Week.astype(int)) | set(df_salaries.Week.astype(int)))
+        self.teams = sorted(set(df_weekly.Team) | set(df_salaries.Team))
+        self.positions = list(globs.POSITIONS)
+
+        # Each player's most recent team and position
+        latest = pd.concat([df_weekly[["Name", "Year", "Week", "Team", "Pos"]],
+                            df_salaries[["Name", "Year", "Week", "Team", "Pos"]]])
+        latest = latest.sort_values(["Year", "Week"]).groupby("Name").last()
+        self.player_names = latest.index.to_numpy()
+        self.player_team = latest.Team.to_numpy()
+        self.player_pos = latest.Pos.to_numpy()
+
+        self.cube = {}
+        self.players = {}
+        for df, stats, count_col in [(df_weekly, globs.STATS, "n"), (df_salaries, globs.SALARY_STATS, "n_salary")]:
+            self._fill(self.cube, df, ["Year", "Week", "Team", "Pos"],
+                       [self.years, self.weeks, self.teams, self.positions], stats, count_col)
+            self._fill(self.players, df, ["Name", "Year", "Week"],
+                       [list(self.player_names), self.years, self.weeks], stats, count_col)
+
+    @staticmethod
+    def _fill(arrays, df, keys, axes, stats, count_col):
+        """Sum stats of df by keys into dense arrays over axes, one per measure."""
+        sums = _group_sums(df, keys, stats, count_col)
+        index = tuple(pd.Index(axis).get_indexer(sums.index.get_level_values(i)) for i, axis in enumerate(axes))
+        for key, idx in zip(keys, index):
+            # -1 would silently add the rows to the axis' last entry
+            if (idx < 0).any():
+                raise ValueError("{} values missing from the cube axis: {}".format(
+                    key, sorted(set(sums.index.get_level_values(key)[idx < 0]))[:10]))
+        shape = tuple(len(axis) for axis in axes)
+        for col in sums.columns:
+            arr = np.zeros(shape, dtype=np.float32)
+            arr[index] = sums[col].to_numpy()
+            arrays[col] = arr
+
+    @classmethod
+    def from_files(cls, weekly_path=globs.file_weekly, salaries_path=globs.file_salaries):
+        return cls(read_weekly(weekly_path), read_salaries(salaries_path))
+
+    def _masks(self, years=None, weeks=None, teams=None, positions=None):
+        """Boolean masks for each axis; None selects everything."""
+        def mask(axis, values):
+            return np.ones(len(axis), bool) if values is None else np.isin(axis, list(values))
+        week_mask = np.ones(len(self.weeks), bool)
+        if weeks is not None:
+            week_mask = (np.array(self.weeks) >= weeks[0]) & (np.array(self.weeks) <= weeks[1])
+        return mask(self.years, years), week_mask, mask(self.teams, teams), mask(self.positions, positions)
+
+    def slice(self, measures, by, years=None, weeks=None, teams=None, positions=None):
+        """
+        Sum measures over the filtered cube, keeping the axis named by
+        ("Year", "Week", "Team" or "Pos"). Returns a data frame indexed by it.
+        """
+        masks = self._masks(years, weeks, teams, positions)
+        axes = ["Year", "Week", "Team", "Pos"]
+        labels = [self.years, self.weeks, self.teams, self.positions]
+        keep = axes.index(by)
+        sel = np.ix_(*masks)
+        other = tuple(i for i in range(4) if i != keep)
+        out = {m: self.cube[m][sel].sum(axis=other) for m in measures}
+        return pd.DataFrame(out, index=pd.Index(np.array(labels[keep])[masks[keep]], name=by))
+
+    def player_totals(self, measures, years=None, weeks=None, teams=None, positions=None):
+        """Sum measures per player over the filtered seasons and weeks, for players on the filtered teams/positions."""
+        year_mask, week_mask, team_mask, pos_mask = self._masks(years, weeks, teams, positions)
+        rows = np.isin(self.player_team, np.array(self.teams)[team_mask]) & \
+            np.isin(self.player_pos, np.array(self.positions)[pos_mask])
+        sel = np.ix_(rows, year_mask, week_mask)
+        out = {m: self.players[m][sel].sum(axis=(1, 2)) for m in measures}
+        df = pd.DataFrame(out, index=pd.Index(self.player_names[rows], name="Name"))
+        df["Team"] = self.player_team[rows]
+        df["Pos"] = self.player_pos[rows]
+        return df
+
+    # Views
+
+    def avg_points_by_position(self, **filters):
+        df = self.slice(["fd_points", "n_salary"], "Pos", **filters)
+        df["value"] = (df.fd_points / df.n_salary.where(df.n_salary > 0)).fillna(0)
+        return df[["value"]]
+
+    def points_vs_salary(self, **filters):
+        """Mean fd_points and fd_salary per player over the weeks they have a salary."""
+        df = self.player_totals(["fd_points", "fd_salary", "n_salary"], **filters)
+        df = df[df.n_salary > 0].copy()
+        df["fd_points"] = df.fd_points / df.n_salary
+        df["fd_salary"] = df.fd_salary / df.n_salary
+        return df.rename(columns={"n_salary": "Weeks"})
+
+    def top_players(self, stat, n=5, **filters):
+        df = self.player_totals([stat], **filters)
+        return df[df[stat] > 0].nlargest(n, stat)
+
+    def team_totals(self, stat, **filters):
+        return self.slice([stat], "Team", **filters).sort_values(stat, ascending=False)
+
+    def weekly_points(self, **filters):
+        """Mean fd_points per salary row for each season and week with data, in time order."""
+        df = self.slice_weeks(["fd_points", "n_salary"], **filters)
+        df = df[df.n_salary > 0].reset_index(drop=True)
+        df["value"] = df.fd_points / df.n_salary
+        return df
+
+    def slice_weeks(self, measures, years=None, weeks=None, teams=None, positions=None):
+        """Sum measures per (season, week), as a data frame with Year, Week and a "period" label."""
+        masks = self._masks(years, weeks, teams, positions)
+        out = {m: self.cube[m][np.ix_(*masks)].sum(axis=(2, 3)).ravel() for m in measures}
+        years_sel = np.array(self.years)[masks[0]]
+        weeks_sel = np.array(self.weeks)[masks[1]]
+        df = pd.DataFrame(out)
+        df["Year"] = np.repeat(years_sel, len(weeks_sel))
+        df["Week"] = np.tile(weeks_sel, len(years_sel))
+        df["period"] = df.Year.astype(str) + "-" + df.Week.astype(str).str.zfill(2)
+        return df
+
+    def weeks_with_data(self):
+        """(season, week) pairs that have any rows."""
+        has = (self.cube["n"] + self.cube["n_salary"]).sum(axis=(2, 3)) > 0
+        return {(self.years[i], self.weeks[j]) for i, j in zip(*np.nonzero(has))}
+
+_cache = {}
+
+def load_cube(weekly_path=globs.file_weekly, salaries_path=globs.file_salaries):
+    """
+    The DashCube for the current contents of the data files. It is rebuilt
+    only when a file's modification time changes, so every dashboard session
+    in the server process shares one copy.
+    """
+    key = (weekly_path, salaries_path)
+    stamp = (os.path.getmtime(weekly_path), os.path.getmtime(salaries_path))
+    cached = _cache.get(key)
+    if cached is None or cached[0] != stamp:
+        _cache[key] = (stamp, DashCube.from_files(weekly_path, salaries_path))
+    return _cache[key][1]
@@ -0,0 +1,271 @@
+"""
+GPP contest simulator. Estimates the expected payout and ROI of candidate
+lineups by playing them against a simulated field of opponent lineups.
+
+- The field is drawn from an ownership model: within each position, players
+  are picked with probability proportional to their ownership (the pool's
+  "ownership" column if it has one, otherwise a softmax of projected points
+  per $1K of salary). Lineups follow the roster and salary limits in
+  lineup_optimizer.globs; lineups over the cap are redrawn.
+- Player outcomes are normal around their projection, with a shared team
+  component so teammates' outcomes are correlated, and are floored at 0.
+- In each simulation the field's scores are sorted once and every candidate
+  lineup is ranked against them with searchsorted. The rank is looked up in a
+  payout table.
+Simulations run in chunks sized to a memory budget, and the chunks can be
+spread over worker processes.
+"""
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+import lineup_optimizer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import worker_pool
+
+class globs():
+    FIELD_SIZE = 10000
+    N_SIMS = 1000
+    ENTRY_FEE = 10.0
+    # (last rank paid, prize) pairs, best ranks first. Ranks past the last pair win nothing.
+    PAYOUTS = [
+        (1, 10000.0), (2, 5000.0), (3, 3000.0), (5, 1500.0), (10, 750.0), (25, 250.0),
+        (50, 125.0), (100, 75.0), (250, 50.0), (500, 35.0), (1000, 25.0), (2000, 20.0)
+    ]
+
+    TEAM_CORR = 0.3 # Share of a player's outcome variance shared with their teammates
+    OWNERSHIP_TEMP = 0.5 # Softmax temperature of the ownership model, in points per $1K
+    MAX_REDRAWS = 50 # Passes at redrawing field lineups that are over the salary cap
+
+    CHUNK_MB = 256 # Memory budget for one chunk of simulations
+    FIELD_CHUNK = 50000 # Field lineups drawn at a time
+    N_JOBS = 1
+
+    col_team = "team"
+    col_own = "ownership"
+
+def ownership(pool, temp=globs.OWNERSHIP_TEMP):
+    """
+    Ownership weights of each player within their position. Uses the pool's
+    ownership column when present, otherwise a softmax of projected points
+    per $1K of salary. Players without a salary are never picked.
+    """
+    if globs.col_own in pool:
+        return pool[globs.col_own].to_numpy(dtype=float)
+    proj = pool[lineup_optimizer.globs.col_proj].to_numpy(dtype=float)
+    sal = pool[lineup_optimizer.globs.col_sal].to_numpy(dtype=float)
+    value = np.full(len(pool), -np.inf)
+    np.divide(proj, sal / 1000, out=value, where=sal > 0)
+    weights = np.zeros(len(pool))
+    positions = pool[lineup_optimizer.globs.col_pos].to_numpy()
+    for pos in np.unique(positions):
+        rows = (positions == pos) & (sal > 0)
+        if not rows.any():
+            continue
+        z = (value[rows] - value[rows].max()) / temp
+        weights[rows] = np.exp(z) / np.exp(z).sum()
+    return weights
+
+def _draw_lineups(n, pos_rows, log_weights, counts_options, rng):
+    """
+    Draw n lineups of pool row numbers. Each lineup picks one of the flex
+    assignments in counts_options at random, then samples that many players
+    per position without replacement (Gumbel top-k on the log weights).
+    """
+    option = rng.integers(len(counts_options), size=n)
+    picks = []
+    for pos, rows in pos_rows.items():
+        counts = np.array([opt.get(pos, 0) for opt in counts_options])[option]
+        k = counts.max()
+        if k == 0:
+            continue
+        keys = log_weights[rows] + rng.gumbel(size=(n, len(rows))).astype(np.float32)
+        top = np.argpartition(-keys, k-1, axis=1)[:, :k]
+        top = np.take_along_axis(top, np.argsort(-np.take_along_axis(keys, top, axis=1), axis=1), axis=1)
+        cand = rows[top]
+        picks.append(np.where(np.arange(k)[None, :] < counts[:, None], cand, -1))
+    cand = np.concatenate(picks, axis=1)
+    roster_size = sum(counts_options[0].values())
+    return cand[cand >= 0].reshape(n, roster_size)
+
+def generate_field(pool, field_size=globs.FIELD_SIZE, roster=lineup_optimizer.globs.ROSTER,
+                   flex=lineup_optimizer.globs.FLEX, sal_max=lineup_optimizer.globs.SAL_MAX,
+                   own=None, seed=None):
+    """
+    Draw field_size opponent lineups from the ownership model. Returns an int
+    array of pool row numbers, one row per lineup. Lineups still over the cap
+    after globs.MAX_REDRAWS redraws are dropped, so the field can be smaller.
+    """
+    rng = np.random.default_rng(seed)
+    if own is None:
+        own = ownership(pool)
+    with np.errstate(divide="ignore"):
+        log_weights = np.log(np.asarray(own, dtype=np.float32))
+    positions = pool[lineup_optimizer.globs.col_pos].to_numpy()
+    counts_options = lineup_optimizer.roster_counts(roster, flex)
+    pos_rows = {pos: np.flatnonzero(positions == pos) for pos in counts_options[0]}
+    sal = pool[lineup_optimizer.globs.col_sal].to_numpy(dtype=float)
+
+    chunks = []
+    for start in range(0, field_size, globs.FIELD_CHUNK):
+        n = min(globs.FIELD_CHUNK, field_size - start)
+        field = _draw_lineups(n, pos_rows, log_weights, counts_options, rng)
+        for _ in range(globs.MAX_REDRAWS):
+            over = sal[field].sum(axis=1) > sal_max
+            if not over.any():
+                break
+            field[over] = _draw_lineups(over.sum(), pos_rows, log_weights, counts_options, rng)
+        chunks.append(field[sal[field].sum(axis=1) <= sal_max])
+    return np.concatenate(chunks).astype(np.int32)
+
+def payout_by_rank(payouts, n_ranks):
+    """Prize for every rank from 1 to n_ranks, as an array indexed by rank (index 0 unused)."""
+    prizes = np.zeros(n_ranks + 1)
+    first = 1
+    for last, prize in payouts:
+        prizes[first:min(last, n_ranks)+1] = prize
+        first = last + 1
+    return prizes
+
+def simulate_outcomes(proj, team_codes, n_sims, sim_std, team_corr, rng):
+    """
+    Draw (n_sims, n_players) fantasy points. Each player's deviation from
+    their projection mixes a team-wide normal draw (weight sqrt(team_corr))
+    with their own, scaled by sim_std * projection.
+    """
+    n_teams = team_codes.max() + 1
+    points = rng.standard_normal((n_sims, n_teams), dtype=np.float32)[:, team_codes]
+    own = rng.standard_normal((n_sims, len(proj)), dtype=np.float32)
+    # In place, so at most two (n_sims, n_players) arrays are alive
+    points *= np.sqrt(team_corr)
+    own *= np.sqrt(1 - team_corr)
+    points += own
+    del own
+    points *= sim_std * np.abs(proj)
+    points += proj
+    return np.maximum(points, 0, out=points)
+
+def lineup_scores(points, lineups):
+    """Sum of points for each lineup: (n_sims, n_players) x (n_lineups, roster) -> (n_sims, n_lineups)."""
+    scores = np.zeros((points.shape[0], lineups.shape[0]), dtype=np.float32)
+    for slot in range(lineups.shape[1]):
+        scores += points[:, lineups[:, slot]]
+    return scores
+
+def rank_against_field(field_scores, scores):
+    """
+    Rank of each candidate score in its simulation's field, 1 being best.
+    A candidate is ranked below every field entry that scores strictly more.
+    field_scores is (n_sims, n_field) and scores is (n_sims, n_lineups).
+    """
+    n_sims, n_field = field_scores.shape
+    # Offset each simulation so the flattened, row-sorted scores are globally sorted:
+    # shifted by the lowest score, every row fits in [0, stride). The offsets need
+    # float64, and the one float64 copy is sorted and offset in place.
+    low = min(field_scores.min(), scores.min())
+    stride = max(field_scores.max(), scores.max()) - low + 1.0
+    offset = (np.arange(n_sims) * stride - low)[:, None]
+    sorted_field = np.empty(field_scores.shape, dtype=np.float64)
+    sorted_field[...] = field_scores
+    sorted_field.sort(axis=1)
+    sorted_field += offset
+    below = np.searchsorted(sorted_field.ravel(), (scores + offset).ravel(), side="right").reshape(scores.shape)
+    below -= (np.arange(n_sims) * n_field)[:, None]
+    return n_field - below + 1
+
+def _simulate_chunk(job):
+    """Run one chunk of simulations; returns summed payout, score, win and cash counts."""
+    n_sims, seed = job
+    s = worker_pool.shared
+    rng = np.random.default_rng(seed)
+    points = simulate_outcomes(s["proj"], s["team_codes"], n_sims, s["sim_std"], s["team_corr"], rng)
+    scores = lineup_scores(points, s["lineups"])
+    field_scores = lineup_scores(points, s["field"])
+    del points # Not needed while ranking, where the field takes the most memory
+    ranks = rank_against_field(field_scores, scores)
+    payout = s["prizes"][ranks]
+    return {
+        "payout": payout.sum(axis=0),
+        "score": scores.sum(axis=0, dtype=np.float64),
+        "wins": (ranks == 1).sum(axis=0),
+        "cashes": (payout > 0).sum(axis=0),
+        "rank_pct": (ranks / (s["field"].shape[0] + 1)).sum(axis=0)
+    }
+
+def sims_per_chunk(n_field, n_players, n_lineups, chunk_mb=globs.CHUNK_MB):
+    """
+    Simulations that fit in chunk_mb. Bytes per simulation, per player, field
+    entry and candidate lineup:
+    - players: the float32 points and one float32 temporary of simulate_outcomes().
+    - field: the float32 field scores, plus either the per-slot float32 temporary
+      of lineup_scores() or the float64 sorted copy of rank_against_field().
+    - lineups: float32 scores and a few float64/int64 arrays of ranks and payouts.
+    """
+    bytes_per_sim = 8 * n_players + 12 * n_field + 48 * n_lineups
+    return max(1, int(chunk_mb * 1e6 // bytes_per_sim))
+
+def simulate_contest(pool, lineups, field=None, field_size=globs.FIELD_SIZE, n_sims=globs.N_SIMS,
+                     payouts=globs.PAYOUTS, entry_fee=globs.ENTRY_FEE,
+                     sim_std=lineup_optimizer.globs.SIM_STD, team_corr=globs.TEAM_CORR,
+                     chunk_mb=globs.CHUNK_MB, n_jobs=globs.N_JOBS, seed=None):
+    """
+    Expected contest results of candidate lineups.
+    Parameters:
+        pool:     player pool with position, proj, fd_salary and team columns.
+        lineups:  candidate lineups, each a list of pool index labels.
+        field:    opponent lineups as pool row numbers (drawn with
+                  generate_field() when not given).
+        payouts:  (last rank paid, prize) pairs, best ranks first.
+    Each candidate is ranked against the field alone, not against the other
+    candidates. Results do not depend on n_jobs for a given seed.
+    Returns a data frame with each lineup's mean score, mean payout, ROI,
+    win rate, cash rate and mean rank as a fraction of the field.
+    """
+    seeds = np.random.SeedSequence(seed)
+    field_seed, sim_seed = seeds.spawn(2)
+    if field is None:
+        field = generate_field(pool, field_size, seed=field_seed)
+    lineups_rows = np.array([pool.index.get_indexer(lineup) for lineup in lineups], dtype=np.int32)
+    if (lineups_rows < 0).any():
+        raise KeyError("Lineups contain players missing from the pool")
+
+    # Handed to the workers once, so the field is not copied with every chunk
+    shared = {
+        "proj": pool[lineup_optimizer.globs.col_proj].to_numpy(dtype=np.float32),
+        "team_codes": pd.factorize(pool[globs.col_team])[0],
+        "field": field,
+        "lineups": lineups_rows,
+        "prizes": payout_by_rank(payouts, field.shape[0] + 1),
+        "sim_std": sim_std,
+        "team_corr": team_corr
+    }
+    chunk = sims_per_chunk(field.shape[0], len(pool), len(lineups), chunk_mb)
+    sizes = [min(chunk, n_sims - start) for start in range(0, n_sims, chunk)]
+    jobs = list(zip(sizes, sim_seed.spawn(len(sizes))))
+
+    if n_jobs <= 1:
+        worker_pool.init_worker(shared)
+        results = [_simulate_chunk(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            mp_context=worker_pool.pool_context(),
+            initializer=worker_pool.init_worker,
+            initargs=(shared,)
+        ) as workers:
+            results = list(workers.map(_simulate_chunk, jobs))
+
+    totals = {key: sum(r[key] for r in results) for key in results[0]}
+    mean_payout = totals["payout"] / n_sims
+    return pd.DataFrame({
+        "lineup": np.arange(len(lineups)),
+        "mean_score": totals["score"] / n_sims,
+        "mean_payout": mean_payout,
+        "roi": (mean_payout - entry_fee) / entry_fee,
+        "win_rate": totals["wins"] / n_sims,
+        "cash_rate": totals["cashes"] / n_sims,
+        "mean_rank_pct": totals["rank_pct"] / n_sims
+    })
@@ -0,0 +1,448 @@
+"""
+Python lineup optimizer. Picks the lineup with the highest total projection
+that fills every roster slot without going over the salary cap, using the
+roster limits from lineup_optimizer.jl.
+
+FanDuel salaries come in $100 increments, so the search is an exact dynamic
+program: for each position, a knapsack table holds the best projection for
+choosing c players with at most s salary units, and the position tables are
+then combined over salary to fill the whole roster.
+
+The player pool is a data frame with one row per player and the columns in
+globs.col_pos, globs.col_proj and globs.col_sal. Lineups are returned as lists
+of the pool's index labels.
+"""
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+from collections import Counter
+from itertools import combinations_with_replacement
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import worker_pool
+
+class globs():
+    # Roster constraint params (see FantasyGameMDP in lineup_optimizer.jl)
+    ROSTER = {"QB": 1, "RB": 2, "WR": 2, "TE": 1}
+    FLEX = 0 # Extra slots that can be filled by any of FLEX_POSITIONS
+    FLEX_POSITIONS = ["RB", "WR", "TE"]
+    SAL_MAX = 60000 # $60K
+    SAL_UNIT = 100 # FanDuel salaries are multiples of $100
+
+    PROJ_NOISE = 0.05 # Std of the projection noise used to vary lineups, as a fraction of projection
+    MAX_ATTEMPTS = 10 # Re-solves per requested lineup before giving up on a new unique lineup
+
+    PRUNE_DEPTH = 2 # Extra dominating players required before pruning in multi-lineup runs
+
+    N_SIMS = 10000 # Monte Carlo draws in simulate_lineups()
+    SIM_STD = 0.4 # Std of a player's simulated points, as a fraction of projection
+
+    col_pos = "position"
+    col_proj = "proj"
+    col_sal = "fd_salary"
+
+def salary_units(sal, unit=globs.SAL_UNIT):
+    """Convert salaries to whole salary units, rounding up so lineups stay under the cap."""
+    return np.ceil(np.asarray(sal, dtype=float) / unit).astype(int)
+
+def position_table(proj, sal, count, budget):
+    """
+    0/1 knapsack over one position's players.
+    Parameters:
+        proj:   array of player projections.
+        sal:    array of player salaries in salary units.
+        count:  most players that will be chosen from this position.
+        budget: salary cap in salary units.
+    Returns (best, take), where best[c, s] is the highest total projection of
+    exactly c players costing at most s, and take[i, c, s] marks that player i
+    improved best[c, s] when it was added (used by pick_players()).
+    """
+    best = np.full((count+1, budget+1), -np.inf)
+    best[0, :] = 0
+    take = np.zeros((len(proj), count+1, budget+1), dtype=bool)
+    for i in range(len(proj)):
+        if sal[i] > budget:
+            continue
+        for c in range(count, 0, -1):
+            cand = np.full(budget+1, -np.inf)
+            cand[sal[i]:] = best[c-1, :budget+1-sal[i]] + proj[i]
+            better = cand > best[c]
+            take[i, c] = better
+            best[c] = np.where(better, cand, best[c])
+    return best, take
+
+def pick_players(take, sal, count, budget):
+    """Backtrack a position_table() to the players behind best[count, budget]."""
+    picks = []
+    c, s = count, budget
+    for i in range(take.shape[0]-1, -1, -1):
+        if c == 0:
+            break
+        if take[i, c, s]:
+            picks.append(i)
+            c -= 1
+            s -= sal[i]
+    return picks[::-1]
+
+def combine_tables(f, g):
+    """
+    Max-plus convolution of two salary tables: h[s] = max over a of f[a] + g[s-a].
+    Returns h and the salary split a chosen for each s.
+    """
+    idx = np.arange(len(f))
+    diff = idx[None, :] - idx[:, None] # diff[a, s] = s - a
+    sums = np.where(diff >= 0, f[:, None] + g[np.clip(diff, 0, None)], -np.inf)
+    split = sums.argmax(axis=0)
+    return sums[split, idx], split
+
+def roster_counts(roster=globs.ROSTER, flex=globs.FLEX, flex_positions=globs.FLEX_POSITIONS):
+    """Every way of assigning the flex slots to positions, as a list of position counts."""
+    options = []
+    for assigned in combinations_with_replacement(flex_positions, flex):
+        counts = dict(roster)
+        for pos in assigned:
+            counts[pos] = counts.get(pos, 0) + 1
+        options.append(counts)
+    return options
+
+def dominated(proj, sal, k):
+    """
+    Boolean mask of the players dominated by at least k others. Player j
+    dominates player i when j costs no more and projects no lower, and is
+    strictly better on one of the two (exact ties go to the earlier player).
+    """
+    proj = np.asarray(proj, dtype=float)
+    sal = np.asarray(sal)
+    order = np.arange(len(proj))
+    no_worse = (sal[:, None] <= sal[None, :]) & (proj[:, None] >= proj[None, :])
+    better = (sal[:, None] < sal[None, :]) | (proj[:, None] > proj[None, :]) | (order[:, None] < order[None, :])
+    # dominates[j, i]: j dominates i
+    dominates = no_worse & better
+    return dominates.sum(axis=0) >= k
+
+def prune_pool(pool, roster=globs.ROSTER, flex=globs.FLEX, depth=0, proj=None, keep=()):
+    """
+    Drop players that cannot appear in an optimal lineup. A lineup takes at
+    most k players from a position (its roster count, plus the flex slots for
+    flex positions), so a player dominated by k others at their position can
+    always be swapped for one of them that is not in the lineup, at no more
+    salary and no less projection. With depth 0 the pruning is exact for the
+    single best lineup; multi-lineup runs that perturb projections should add
+    a depth margin to keep more near-dominated players.
+    Parameters:
+        proj: projections to prune on (defaults to the pool's).
+        keep: labels that are never dropped.
+    Returns the pruned pool and the share of players removed.
+    """
+    if proj is None:
+        proj = pool[globs.col_proj].to_numpy(dtype=float)
+    sal = salary_units(pool[globs.col_sal])
+    positions = pool[globs.col_pos].to_numpy()
+    drop = np.zeros(len(pool), dtype=bool)
+    for pos in np.unique(positions):
+        k = roster.get(pos, 0) + (flex if pos in globs.FLEX_POSITIONS else 0) + depth
+        rows = np.flatnonzero(positions == pos)
+        drop[rows] = dominated(proj[rows], sal[rows], k)
+    drop &= ~pool.index.isin(keep)
+    pruned = pool[~drop]
+    reduction = 1 - len(pruned) / len(pool) if len(pool) else 0.0
+    return pruned, reduction
+
+class LineupOptimizer():
+    """
+    Holds a player pool and its per-position knapsack tables. The tables are
+    built once per set of projections, after which solve() can fill any subset
+    of the roster under any budget without rebuilding them.
+    """
+    def __init__(self, pool, roster=globs.ROSTER, flex=globs.FLEX, sal_max=globs.SAL_MAX):
+        self.pool = pool
+        self.roster = roster
+        self.flex = flex
+        self.budget = int(sal_max // globs.SAL_UNIT)
+        self.max_counts = {}
+        for counts in roster_counts(roster, flex):
+            for pos, count in counts.items():
+                self.max_counts[pos] = max(count, self.max_counts.get(pos, 0))
+        self.pos_rows = {
+            pos: np.flatnonzero(pool[globs.col_pos].to_numpy() == pos) for pos in self.max_counts
+        }
+        self.sal = salary_units(pool[globs.col_sal])
+
+    def build_tables(self, proj=None):
+        """Build the knapsack table for each position from proj (defaults to the pool's projections)."""
+        if proj is None:
+            proj = self.pool[globs.col_proj].to_numpy(dtype=float)
+        self.proj = np.asarray(proj, dtype=float)
+        self.tables = {}
+        for pos, rows in self.pos_rows.items():
+            self.tables[pos] = position_table(self.proj[rows], self.sal[rows], self.max_counts[pos], self.budget)
+        self.combined = {}
+
+    def combine_positions(self, positions, counts):
+        """
+        Combined salary table for filling counts from positions, with the splits
+        needed to backtrack it. Cached, since every budget shares the same table.
+        """
+        key = tuple((pos, counts[pos]) for pos in positions)
+        if key not in self.combined:
+            total = self.tables[positions[0]][0][counts[positions[0]]]
+            splits = []
+            for pos in positions[1:]:
+                total, split = combine_tables(total, self.tables[pos][0][counts[pos]])
+                splits.append(split)
+            self.combined[key] = (total, splits)
+        return self.combined[key]
+
+    def solve_counts(self, counts, budget):
+        """
+        Best players for the given position counts within budget salary units.
+        Returns (total projection, row numbers into the pool), or (-inf, None)
+        if the counts cannot be filled.
+        """
+        positions = [pos for pos, count in counts.items() if count > 0]
+        if not positions:
+            return 0.0, []
+        if any(len(self.pos_rows[pos]) < counts[pos] for pos in positions):
+            return -np.inf, None
+        total, splits = self.combine_positions(positions, counts)
+        if budget < 0 or not np.isfinite(total[budget]):
+            return -np.inf, None
+
+        # Walk the splits back to each position's share of the budget
+        rows = []
+        s = budget
+        for pos, split in zip(positions[:0:-1], splits[::-1]):
+            a = split[s]
+            picks = pick_players(self.tables[pos][1], self.sal[self.pos_rows[pos]], counts[pos], s - a)
+            rows += self.pos_rows[pos][picks].tolist()
+            s = a
+        pos = positions[0]
+        picks = pick_players(self.tables[pos][1], self.sal[self.pos_rows[pos]], counts[pos], s)
+        rows += self.pos_rows[pos][picks].tolist()
+        return total[budget], rows
+
+    def solve(self, counts_options=None, budget=None):
+        """
+        Best lineup over every flex assignment in counts_options (defaults to
+        the full roster). Returns (total projection, row numbers into the pool).
+        """
+        if counts_options is None:
+            counts_options = roster_counts(self.roster, self.flex)
+        if budget is None:
+            budget = self.budget
+        best = (-np.inf, None)
+        for counts in counts_options:
+            result = self.solve_counts(counts, budget)
+            if result[0] > best[0]:
+                best = result
+        return best
+
+def optimize_lineup(pool, roster=globs.ROSTER, flex=globs.FLEX, sal_max=globs.SAL_MAX, prune=True):
+    """
+    Return the single highest-projected lineup as a list of pool index labels.
+    With prune, dominated players are dropped first (see prune_pool()).
+    """
+    if prune:
+        pool, _ = prune_pool(pool, roster, flex)
+    opt = LineupOptimizer(pool, roster, flex, sal_max)
+    opt.build_tables()
+    _, rows = opt.solve()
+    if rows is None:
+        return None
+    return pool.index[rows].tolist()
+
+def optimize_lineups(pool, n_lineups, roster=globs.ROSTER, flex=globs.FLEX,
+                     sal_max=globs.SAL_MAX, proj_noise=globs.PROJ_NOISE, seed=None,
+                     prune=True, prune_depth=globs.PRUNE_DEPTH):
+    """
+    Return up to n_lineups unique lineups. The first lineup is the optimal one;
+    the rest are solved against projections with a random normal step added,
+    as in update_proj() in lineup_optimizer.jl. With prune, players dominated
+    by prune_depth more players than prune_pool() needs are dropped first.
+    """
+    rng = np.random.default_rng(seed)
+    if prune:
+        pool, _ = prune_pool(pool, roster, flex, depth=prune_depth if n_lineups > 1 else 0)
+    opt = LineupOptimizer(pool, roster, flex, sal_max)
+    base_proj = pool[globs.col_proj].to_numpy(dtype=float)
+    lineups = []
+    seen = set()
+    for attempt in range(n_lineups * globs.MAX_ATTEMPTS):
+        if len(lineups) == n_lineups:
+            break
+        if attempt == 0:
+            proj = base_proj
+        else:
+            proj = np.maximum(base_proj + rng.normal(0, proj_noise * np.abs(base_proj) + 1e-9), 0)
+        opt.build_tables(proj)
+        _, rows = opt.solve()
+        if rows is None:
+            break
+        key = frozenset(rows)
+        if key not in seen:
+            seen.add(key)
+            lineups.append(pool.index[rows].tolist())
+    return lineups
+
+def swap_lineup(opt, lineup, locked, pos_of, sal_of):
+    """
+    Re-solve the unlocked slots of one lineup.
+    Parameters:
+        opt:     LineupOptimizer over the unlocked players, with tables built.
+        lineup:  list of player labels.
+        locked:  set of locked player labels.
+        pos_of:  dict of player label to position, for every player in lineup.
+        sal_of:  dict of player label to salary units, for every player in lineup.
+    The lineup's locked players are kept. Its unlocked players are the starting
+    solution, and are only replaced by a lineup with a higher projection. If the
+    open slots cannot be filled, the lineup is returned unchanged.
+    """
+    kept = [p for p in lineup if p in locked]
+    prev = [p for p in lineup if p not in locked]
+    kept_counts = Counter(pos_of[p] for p in kept)
+    budget = opt.budget - sum(sal_of[p] for p in kept)
+
+    counts_options = []
+    for counts in roster_counts(opt.roster, opt.flex):
+        if all(kept_counts[pos] <= counts.get(pos, 0) for pos in kept_counts):
+            counts_options.append({pos: count - kept_counts[pos] for pos, count in counts.items()})
+    value, rows = opt.solve(counts_options, budget)
+
+    prev_rows = opt.pool.index.get_indexer(prev)
+    prev_counts = Counter(pos_of[p] for p in prev)
+    if (prev_rows >= 0).all() and opt.sal[prev_rows].sum() <= budget and \
+            any(prev_counts == Counter({pos: c for pos, c in counts.items() if c > 0}) for counts in counts_options):
+        if rows is None or value <= opt.proj[prev_rows].sum():
+            return list(lineup)
+    if rows is None:
+        return list(lineup)
+    return kept + opt.pool.index[rows].tolist()
+
+def _swap_batch(lineups):
+    s = worker_pool.shared
+    return [swap_lineup(s["opt"], lineup, s["locked"], s["pos_of"], s["sal_of"]) for lineup in lineups]
+
+def _next_fill(available, lineup, dup, seen, locked, pos_of, sal_of, roster, flex, sal_max, prune, members):
+    """
+    Best fill of lineup's unlocked slots that is not in seen, or None. The
+    next-best fill after dup lacks at least one of dup's unlocked players, so
+    it is the best of the re-solves that each leave one of them out.
+    """
+    best = (-np.inf, None)
+    for player in dup:
+        if player in locked:
+            continue
+        sub = available.drop(player)
+        if prune:
+            sub, _ = prune_pool(sub, roster, flex, keep=members.drop(player, errors="ignore"))
+        opt = LineupOptimizer(sub, roster, flex, sal_max)
+        opt.build_tables()
+        fill = swap_lineup(opt, lineup, locked, pos_of, sal_of)
+        value = sub[globs.col_proj].reindex(fill).sum()
+        if frozenset(fill) not in seen and value > best[0]:
+            best = (value, fill)
+    return best[1]
+
+def _unique_swaps(available, lineups, swapped, locked, pos_of, sal_of, roster, flex, sal_max, prune, members):
+    """
+    Walk the swapped lineups in order. One that repeats an earlier lineup goes
+    back to its previous fill if that is still unique, and otherwise takes the
+    next-best fill that is. If neither exists it keeps its previous fill.
+    """
+    seen = set()
+    unique = []
+    for lineup, new in zip(lineups, swapped):
+        if frozenset(new) in seen:
+            if frozenset(lineup) not in seen:
+                new = list(lineup)
+            else:
+                new = _next_fill(available, lineup, new, seen, locked, pos_of, sal_of,
+                                 roster, flex, sal_max, prune, members) or list(lineup)
+        seen.add(frozenset(new))
+        unique.append(new)
+    return unique
+
+def late_swap(pool, lineups, locked, roster=globs.ROSTER, flex=globs.FLEX,
+              sal_max=globs.SAL_MAX, n_jobs=1, prune=True, unique=True):
+    """
+    Re-optimize existing lineups once some games have started.
+    Parameters:
+        pool:    player pool with updated projections and salaries. Must
+                 include every player in lineups, locked or not.
+        lineups: list of lineups, each a list of pool index labels.
+        locked:  labels of players whose games have started. They stay in the
+                 lineups that have them and cannot be added to others.
+        n_jobs:  worker processes to split the lineups between.
+        prune:   drop dominated unlocked players first (see prune_pool()).
+        unique:  keep the portfolio free of repeats. Lineups sharing locked
+                 players often re-solve to the same fill; a repeat goes back to
+                 its previous fill, or else the next-best unique fill. Lineups
+                 that were already repeats before the swap may stay so.
+    The knapsack tables for the unlocked players are built once and shared by
+    every lineup, so each lineup only has to combine and backtrack them.
+    Returns the new lineups in the same order.
+    """
+    locked = set(locked)
+    members = pd.Index(set().union(*lineups))
+    candidates = pool[~pool.index.isin(locked)]
+    available = candidates
+    if prune:
+        # Keep the lineups' own players so they can be kept as the starting solution
+        available, _ = prune_pool(candidates, roster, flex, keep=members)
+    opt = LineupOptimizer(available, roster, flex, sal_max)
+    opt.build_tables()
+    pos_of = pool.loc[members, globs.col_pos].to_dict()
+    sal_of = dict(zip(members, salary_units(pool.loc[members, globs.col_sal])))
+
+    if n_jobs <= 1:
+        swapped = [swap_lineup(opt, lineup, locked, pos_of, sal_of) for lineup in lineups]
+    else:
+        # The workers get the optimizer with its tables built instead of rebuilding them
+        shared = {"opt": opt, "locked": locked, "pos_of": pos_of, "sal_of": sal_of}
+        batches = [lineups[i::n_jobs] for i in range(n_jobs)]
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            mp_context=worker_pool.pool_context(),
+            initializer=worker_pool.init_worker,
+            initargs=(shared,)
+        ) as workers:
+            results = list(workers.map(_swap_batch, batches))
+        # Undo the round-robin split
+        swapped = [None] * len(lineups)
+        for i, batch in enumerate(results):
+            swapped[i::n_jobs] = batch
+    if unique:
+        # Pruning is redone per left-out player, since a player it dropped may be needed once one is gone
+        swapped = _unique_swaps(candidates, lineups, swapped, locked, pos_of, sal_of,
+                                roster, flex, sal_max, prune, members)
+    return swapped
+
+def simulate_lineups(pool, lineups, n_sims=globs.N_SIMS, sim_std=globs.SIM_STD, seed=None):
+    """
+    Monte Carlo lineup scores. Each player's points are drawn independently
+    from a normal around their projection with std sim_std * projection,
+    floored at 0. Returns a data frame with the mean, std and 10th, 50th and
+    90th percentile score of each lineup.
+    """
+    rng = np.random.default_rng(seed)
+    members = pd.Index(set().union(*lineups))
+    proj = pool.loc[members, globs.col_proj].to_numpy(dtype=float)
+    draws = np.maximum(rng.normal(proj, sim_std * np.abs(proj), (n_sims, len(members))), 0)
+    scores = np.column_stack([draws[:, members.get_indexer(lineup)].sum(axis=1) for lineup in lineups])
+    pcts = np.percentile(scores, [10, 50, 90], axis=0)
+    return pd.DataFrame({
+        "lineup": np.arange(len(lineups)),
+        "mean": scores.mean(axis=0),
+        "std": scores.std(axis=0),
+        "p10": pcts[0],
+        "p50": pcts[1],
+        "p90": pcts[2]
+    })
+
+def lineups_frame(pool, lineups):
+    """Long-format data frame of lineups with a 'lineup' number column."""
+    frames = [pool.loc[lineup].assign(lineup=n) for n, lineup in enumerate(lineups)]
+    return pd.concat(frames)
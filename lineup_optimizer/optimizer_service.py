@@ -0,0 +1,325 @@
+"""
+Long-running local lineup optimization service. Loads a slate's player pool,
+salaries and projections into memory once, then answers JSON requests over
+HTTP on localhost. A threaded server lets several clients connect at once.
+
+Endpoints:
+- GET  /players                  pool with current projections
+- GET  /stats                    cache hits, misses and size
+- POST /optimize                 {"n_lineups", "exclude", "proj_noise", "seed"}
+- POST /simulate                 {"lineups", "n_sims", "sim_std", "seed"}
+- POST /late_swap                {"lineups", "locked"}
+- POST /projections              {"proj": {full_name: projection}}
+
+Players are identified by full_name. Results are cached by endpoint and
+request body. Every cache entry records the players it depends on: the
+non-excluded players for /optimize, the unlocked players for /late_swap, and
+the lineup players for /simulate. A projection update only drops the entries that depend on a
+player whose projection changed.
+
+Usage:
+    python optimizer_service.py ../data/fanduel_salaries/fd_salaries_2019.csv --week 16 \\
+        --projections proj_week16.csv --port 8765
+"""
+
+import json
+import argparse
+import threading
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import lineup_optimizer
+
+class globs():
+    HOST = "127.0.0.1"
+    PORT = 8765
+    CACHE_SIZE = 512 # Most results kept in the cache before the oldest are dropped
+
+def load_slate(salaries_path, week, projections_path=None):
+    """
+    Player pool for one week of a FanDuel salaries file, indexed by full_name.
+    Projections are read from projections_path (columns full_name, proj) when
+    given; otherwise players are projected at their fd_points.
+    """
+    df = pd.read_csv(salaries_path)
+    df = df[pd.to_numeric(df.Week, errors="coerce") == week] # Also drops repeated header rows
+    pool = pd.DataFrame({
+        "full_name": df.LastName.str.strip() + " " + df.FirstName.str.strip(),
+        "team": df.Team.str.upper(),
+        "position": df.Pos,
+        "fd_salary": pd.to_numeric(df.fd_salary),
+        "proj": pd.to_numeric(df.fd_points)
+    })
+    pool = pool[pool.position.isin(lineup_optimizer.globs.ROSTER)].dropna(subset=["fd_salary"])
+    pool = pool.drop_duplicates("full_name").set_index("full_name")
+    if projections_path:
+        proj = pd.read_csv(projections_path).set_index("full_name")["proj"]
+        pool["proj"] = proj.reindex(pool.index).fillna(0)
+    pool["proj"] = pool["proj"].fillna(0)
+    return pool
+
+class ServiceError(Exception):
+    """Raised for bad requests; answered with a 400 and the message."""
+    pass
+
+class SlateState():
+    """
+    In-memory slate and result cache shared by all request threads. The pool is
+    never modified in place: a projection update swaps in a new data frame, so
+    a request can work on the pool it started with without holding the lock.
+    """
+    def __init__(self, pool):
+        self.pool = pool
+        self.lock = threading.Lock()
+        self.cache = OrderedDict() # key -> (result, players it depends on)
+        self.dependents = {} # player -> cache keys that depend on them
+        self.running = {} # key -> Event set when its computation finishes
+        self.n_updates = 0
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, endpoint, body, compute):
+        """
+        Return the cached result for (endpoint, body), or run compute(pool),
+        which returns (result, players the result depends on), and cache it.
+        Identical requests that arrive while it is computing wait for it.
+        """
+        key = endpoint + json.dumps(body, sort_keys=True)
+        while True:
+            with self.lock:
+                if key in self.cache:
+                    self.cache.move_to_end(key)
+                    self.hits += 1
+                    return self.cache[key][0]
+                running = self.running.get(key)
+                if running is None:
+                    running = self.running[key] = threading.Event()
+                    self.misses += 1
+                    pool = self.pool
+                    n_updates = self.n_updates
+                    break
+            running.wait()
+        try:
+            result, players = compute(pool)
+            with self.lock:
+                # Results computed while projections changed may be stale; don't keep them
+                if self.n_updates == n_updates:
+                    self._store(key, result, players)
+        finally:
+            with self.lock:
+                del self.running[key]
+            running.set()
+        return result
+
+    def _store(self, key, result, players):
+        self.cache[key] = (result, players)
+        for player in players:
+            self.dependents.setdefault(player, set()).add(key)
+        while len(self.cache) > globs.CACHE_SIZE:
+            old_key, (_, old_players) = self.cache.popitem(last=False)
+            self._forget(old_key, old_players)
+
+    def _forget(self, key, players):
+        """Remove key from the dependents index of players."""
+        for player in players:
+            keys = self.dependents.get(player)
+            if keys is not None:
+                keys.discard(key)
+
+    def update_projections(self, proj):
+        """
+        Set new projections ({full_name: proj}) and drop the cache entries that
+        depend on any player whose projection changed.
+        Returns the number of players changed and cache entries dropped.
+        """
+        unknown = [p for p in proj if p not in self.pool.index]
+        if unknown:
+            raise ServiceError("Unknown players: {}".format(unknown[:10]))
+        with self.lock:
+            new = pd.Series(proj, dtype=float)
+            old = self.pool.loc[new.index, "proj"]
+            changed = new.index[new.to_numpy() != old.to_numpy()]
+            if len(changed) == 0:
+                return {"changed": 0, "invalidated": 0}
+            pool = self.pool.copy()
+            pool.loc[changed, "proj"] = new[changed]
+            self.pool = pool
+            self.n_updates += 1
+            stale = set()
+            for player in changed:
+                stale |= self.dependents.pop(player, set())
+            for key in stale:
+                _, players = self.cache.pop(key)
+                self._forget(key, players)
+        return {"changed": len(changed), "invalidated": len(stale)}
+
+    def optimize(self, body):
+        n_lineups = int(body.get("n_lineups", 1))
+        exclude = set(body.get("exclude", []))
+        proj_noise = float(body.get("proj_noise", lineup_optimizer.globs.PROJ_NOISE))
+        seed = body.get("seed", 0)
+
+        def compute(pool):
+            candidates = pool[~pool.index.isin(exclude)]
+            lineups = lineup_optimizer.optimize_lineups(candidates, n_lineups, proj_noise=proj_noise, seed=seed)
+            # Any candidate can enter the optimal lineup once their projection changes, so all of them count
+            return {"lineups": lineups}, set(candidates.index)
+        return self.cached("/optimize", body, compute)
+
+    def simulate(self, body):
+        lineups = self._lineups(body)
+        n_sims = int(body.get("n_sims", lineup_optimizer.globs.N_SIMS))
+        sim_std = float(body.get("sim_std", lineup_optimizer.globs.SIM_STD))
+        seed = body.get("seed", 0)
+
+        def compute(pool):
+            sims = lineup_optimizer.simulate_lineups(pool, lineups, n_sims, sim_std, seed)
+            return {"simulations": sims.to_dict(orient="records")}, set().union(*lineups)
+        return self.cached("/simulate", body, compute)
+
+    def late_swap(self, body):
+        lineups = self._lineups(body)
+        locked = body.get("locked", [])
+
+        def compute(pool):
+            swapped = lineup_optimizer.late_swap(pool, lineups, locked)
+            # Locked players stay where they are whatever their projection
+            return {"lineups": swapped}, set(pool.index) - set(locked)
+        return self.cached("/late_swap", body, compute)
+
+    def players(self):
+        pool = self.pool
+        return {"players": pool.reset_index().to_dict(orient="records")}
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.cache),
+                    "projection_updates": self.n_updates}
+
+    def _lineups(self, body):
+        lineups = body.get("lineups")
+        if not lineups:
+            raise ServiceError("'lineups' is required")
+        unknown = [p for lineup in lineups for p in lineup if p not in self.pool.index]
+        if unknown:
+            raise ServiceError("Unknown players: {}".format(unknown[:10]))
+        return lineups
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep connections open between requests
+
+    def read_body(self):
+        """
+        Read the whole request body before anything is answered, so a
+        kept-alive connection never parses leftover body bytes as the next
+        request. Returns None (and closes the connection after the response)
+        when Content-Length is invalid, since the body's end is then unknown.
+        """
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            return None
+        return self.rfile.read(length)
+
+    def do_GET(self):
+        if self.read_body() is None:
+            return self.respond(400, {"error": "Invalid Content-Length"})
+        slate = self.server.slate
+        routes = {"/players": slate.players, "/stats": slate.stats}
+        if self.path not in routes:
+            return self.respond(404, {"error": "Unknown path: {}".format(self.path)})
+        self.respond(200, routes[self.path]())
+
+    def do_POST(self):
+        data = self.read_body()
+        if data is None:
+            return self.respond(400, {"error": "Invalid Content-Length"})
+        slate = self.server.slate
+        routes = {
+            "/optimize": slate.optimize,
+            "/simulate": slate.simulate,
+            "/late_swap": slate.late_swap,
+            "/projections": lambda body: slate.update_projections(body.get("proj", {}))
+        }
+        if self.path not in routes:
+            return self.respond(404, {"error": "Unknown path: {}".format(self.path)})
+        try:
+            body = json.loads(data or b"{}")
+            result = routes[self.path](body)
+        except (ValueError, TypeError, ServiceError) as e:
+            return self.respond(400, {"error": str(e)})
+        except Exception as e:
+            return self.respond(500, {"error": repr(e)})
+        self.respond(200, result)
+
+    def respond(self, status, result):
+        data = json.dumps(result, default=_to_json).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+def _to_json(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError("Not JSON serializable: {}".format(type(obj)))
+
+class OptimizerServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, pool, host=globs.HOST, port=globs.PORT, verbose=False):
+        super().__init__((host, port), ServiceHandler)
+        self.slate = SlateState(pool)
+        self.verbose = verbose
+
+def serve_in_thread(pool, host=globs.HOST, port=0):
+    """
+    Start a server in a background thread (port 0 picks a free port).
+    Returns the server; its address is server.server_address and
+    server.shutdown() stops it.
+    """
+    server = OptimizerServer(pool, host, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def call(path, body=None, host=globs.HOST, port=globs.PORT, timeout=60):
+    """Send a request to a running service and return the decoded JSON response."""
+    url = "http://{}:{}{}".format(host, port, path)
+    data = None if body is None else json.dumps(body).encode()
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve lineup optimization for one slate.")
+    parser.add_argument("salaries", help="FanDuel salaries CSV")
+    parser.add_argument("--week", type=int, required=True)
+    parser.add_argument("--projections", help="CSV with full_name and proj columns")
+    parser.add_argument("--host", default=globs.HOST)
+    parser.add_argument("--port", type=int, default=globs.PORT)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    pool = load_slate(args.salaries, args.week, args.projections)
+    server = OptimizerServer(pool, args.host, args.port, args.verbose)
+    print("Serving {} players on http://{}:{}".format(len(pool), args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
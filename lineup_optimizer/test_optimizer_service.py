@@ -0,0 +1,92 @@
+"""
+Round trip against optimizer_service on localhost: optimize, late swap, then
+projection updates that should and should not invalidate the cached results.
+
+Usage:
+    python -m pytest lineup_optimizer/test_optimizer_service.py
+"""
+
+import json
+import http.client
+import urllib.error
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import optimizer_service
+
+def make_pool(seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for pos, n in [("QB", 4), ("RB", 8), ("WR", 8), ("TE", 4)]:
+        for i in range(n):
+            rows.append(("{}{}".format(pos, i), pos, int(rng.integers(45, 95)) * 100, float(rng.uniform(5, 25))))
+    return pd.DataFrame(rows, columns=["full_name", "position", "fd_salary", "proj"]).set_index("full_name")
+
+@pytest.fixture
+def server():
+    server = optimizer_service.serve_in_thread(make_pool())
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_round_trip(server):
+    host, port = server.server_address
+
+    def call(path, body=None):
+        return optimizer_service.call(path, body, host, port)
+
+    lineups = call("/optimize", {"n_lineups": 3, "seed": 1})["lineups"]
+    assert len(lineups) == 3
+    assert len({frozenset(lineup) for lineup in lineups}) == 3
+    assert call("/optimize", {"n_lineups": 3, "seed": 1})["lineups"] == lineups
+    assert call("/stats")["hits"] == 1
+
+    locked = [lineups[0][0]]
+    swap = {"lineups": lineups, "locked": locked}
+    swapped = call("/late_swap", swap)["lineups"]
+    assert all(locked[0] in new for old, new in zip(lineups, swapped) if locked[0] in old)
+    assert len({frozenset(lineup) for lineup in swapped}) == len(swapped)
+
+    # A locked player's projection does not affect the late swap, but does affect /optimize
+    update = call("/projections", {"proj": {locked[0]: 99.0}})
+    assert update == {"changed": 1, "invalidated": 1}
+    call("/late_swap", swap)
+    assert call("/stats")["hits"] == 2
+
+    # An unlocked player's projection does
+    unlocked = next(p for p in server.slate.pool.index if p not in locked)
+    update = call("/projections", {"proj": {unlocked: 0.0}})
+    assert update == {"changed": 1, "invalidated": 1}
+    call("/late_swap", swap)
+    assert call("/stats") == {"hits": 2, "misses": 3, "entries": 1, "projection_updates": 2}
+
+def test_bad_request(server):
+    host, port = server.server_address
+    with pytest.raises(urllib.error.HTTPError) as err:
+        optimizer_service.call("/simulate", {"lineups": [["nobody"]]}, host, port)
+    assert err.value.code == 400
+
+def test_connection_reuse_after_error(server):
+    """Error responses must leave a kept-alive connection ready for the next request."""
+    host, port = server.server_address
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    body = json.dumps({"n_lineups": 1})
+    requests = [
+        ("POST", "/nope", body, 404),
+        ("GET", "/stats", None, 200),
+        ("POST", "/simulate", body, 400),
+        ("GET", "/stats", None, 200)
+    ]
+    try:
+        sock = None
+        for method, path, data, status in requests:
+            conn.request(method, path, data, {"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            resp.read()
+            assert resp.status == status, path
+            assert sock is None or conn.sock is sock # Same connection throughout
+            sock = conn.sock
+    finally:
+        conn.close()
@@ -0,0 +1,291 @@
+"""
+Stage-level instrumentation for the projection pipeline. Decorated stages
+record wall time, CPU time, memory and the rows/columns of the data frame
+going in and coming out. "cpu_s" is the CPU time of this process and
+"child_cpu_s" that of the worker processes that finished during the stage
+(e.g. a process pool shut down inside it), so a parallel stage's CPU time is
+their sum. Per-week loops wrapped in timed_loop() record their
+iteration count and per-iteration times.
+
+Records are written as JSON lines to a log file, and each outermost stage can
+also be dumped as a cProfile .prof file. Instrumentation is off by default, in
+which case a stage costs one flag check and timed_loop() returns its iterable
+unchanged. Turn it on with enable(), or by setting the environment variables
+NFL_INSTRUMENT_LOG (JSON log path) and NFL_PROFILE_DIR (cProfile dump dir).
+
+Memory: on Linux the kernel's peak RSS counter is reset when a stage starts
+(by writing "5" to /proc/self/clear_refs) and VmHWM is read when it ends, so
+"peak_rss_mb" is the peak during that stage alone. Where that is not
+available, a stage records "rss_start_mb", "rss_end_mb" and "rss_change_mb"
+instead, which say nothing about the peak in between.
+"""
+
+import os
+import json
+import time
+import cProfile
+import functools
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError: # Not available on Windows, where child_cpu_s is None
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+class globs():
+    ENV_LOG = "NFL_INSTRUMENT_LOG"
+    ENV_PROFILE_DIR = "NFL_PROFILE_DIR"
+    PROC_STATUS = "/proc/self/status"
+    PROC_CLEAR_REFS = "/proc/self/clear_refs"
+
+class _State():
+    def __init__(self):
+        self.enabled = False
+        self.log_path = None
+        self.profile_dir = None
+        self.records = []
+        self.labels = {}
+        self.stack = [] # Names of the stages currently running
+        self.peaks = [] # Peak RSS so far of each running stage, when tracked per stage
+        self.stage_peaks = None # Whether the peak RSS can be reset, checked on first use
+        self.profiling = False
+        self.n_profiles = 0
+
+_state = _State()
+
+def enable(log_path=None, profile_dir=None):
+    """
+    Start recording. Records are appended to log_path as JSON lines (if given)
+    and always kept in memory for records(). With profile_dir, each outermost
+    stage is also profiled to profile_dir/<n>_<stage>.prof.
+    """
+    _state.enabled = True
+    _state.log_path = log_path
+    _state.profile_dir = profile_dir
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+
+def disable():
+    _state.enabled = False
+
+def is_enabled():
+    return _state.enabled
+
+def records():
+    """Records made since the process started or reset() was called."""
+    return list(_state.records)
+
+def reset():
+    _state.records = []
+
+@contextmanager
+def context(**labels):
+    """Add labels (e.g. year=2019) to every record made inside the block."""
+    if not _state.enabled:
+        yield
+        return
+    saved = _state.labels
+    _state.labels = dict(saved, **labels)
+    try:
+        yield
+    finally:
+        _state.labels = saved
+
+def child_cpu_time():
+    """User + system CPU seconds of the finished child processes, or None if unavailable."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def _proc_status_mb(field):
+    """A memory field (e.g. "VmRSS", "VmHWM") of /proc/self/status in MB, or None."""
+    try:
+        with open(globs.PROC_STATUS) as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1e3
+    except OSError:
+        pass
+    return None
+
+def rss_mb():
+    """Current resident set size of this process in MB, or None if it cannot be read."""
+    rss = _proc_status_mb("VmRSS")
+    if rss is None and psutil is not None:
+        rss = psutil.Process().memory_info().rss / 1e6
+    return rss
+
+def _reset_peak():
+    """Reset the kernel's peak RSS (VmHWM) to the current RSS. False where that is not supported."""
+    try:
+        with open(globs.PROC_CLEAR_REFS, "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return _proc_status_mb("VmHWM") is not None
+
+def _stage_peaks():
+    if _state.stage_peaks is None:
+        _state.stage_peaks = _reset_peak()
+    return _state.stage_peaks
+
+def _memory_start():
+    """
+    Called when a stage starts. With per-stage peaks, the running stage's peak
+    so far is saved before the counter is reset for the new stage. Otherwise
+    returns the current RSS.
+    """
+    if _stage_peaks():
+        hwm = _proc_status_mb("VmHWM")
+        if _state.peaks:
+            _state.peaks[-1] = max(_state.peaks[-1], hwm)
+        _reset_peak()
+        _state.peaks.append(_proc_status_mb("VmHWM"))
+        return None
+    return rss_mb()
+
+def _memory_end(rss_start):
+    """Memory fields of a stage's record. A nested stage's peak also counts toward its parent's."""
+    if _stage_peaks():
+        peak = max(_state.peaks.pop(), _proc_status_mb("VmHWM"))
+        if _state.peaks:
+            _state.peaks[-1] = max(_state.peaks[-1], peak)
+        return {"peak_rss_mb": peak}
+    rss_end = rss_mb()
+    change = rss_end - rss_start if rss_start is not None and rss_end is not None else None
+    return {"rss_start_mb": rss_start, "rss_end_mb": rss_end, "rss_change_mb": change}
+
+def _shape(obj):
+    shape = getattr(obj, "shape", None)
+    if not shape: # None, or a 0-d array or scalar
+        return None, None
+    return shape[0], (shape[1] if len(shape) > 1 else 1)
+
+def _emit(record):
+    record.update(_state.labels)
+    _state.records.append(record)
+    if _state.log_path:
+        with open(_state.log_path, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+
+def stage(name=None, frame=None, frame_in=None):
+    """
+    Decorator that records a pipeline stage.
+    Parameters:
+        name:  name of the stage (defaults to the function's qualified name).
+        frame: for methods that update a data frame attribute in place, the
+               name of that attribute (e.g. "df_model"). It is measured before
+               and after the call. Otherwise the first argument with a shape
+               is the input and the return value is the output.
+        frame_in: attribute measured before the call, when it differs from
+               frame (e.g. a method that builds df_model from df_player).
+    """
+    def decorator(fn):
+        stage_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return fn(*args, **kwargs)
+            return _run_stage(stage_name, frame, frame_in or frame, fn, args, kwargs)
+        return wrapper
+    return decorator
+
+def _run_stage(stage_name, frame, frame_in, fn, args, kwargs):
+    if frame_in is not None:
+        rows_in, cols_in = _shape(getattr(args[0], frame_in, None))
+    else:
+        rows_in, cols_in = next((_shape(a) for a in args if hasattr(a, "shape")), (None, None))
+
+    profiler = None
+    if _state.profile_dir and not _state.profiling:
+        profiler = cProfile.Profile()
+        _state.profiling = True
+    parent = _state.stack[-1] if _state.stack else None
+    _state.stack.append(stage_name)
+    rss_start = _memory_start()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    child_cpu_start = child_cpu_time()
+    try:
+        if profiler is not None:
+            result = profiler.runcall(fn, *args, **kwargs)
+        else:
+            result = fn(*args, **kwargs)
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        child_cpu = child_cpu_time() - child_cpu_start if child_cpu_start is not None else None
+        _state.stack.pop()
+        memory = _memory_end(rss_start)
+        if profiler is not None:
+            _state.profiling = False
+            _state.n_profiles += 1
+            profiler.dump_stats(os.path.join(
+                _state.profile_dir, "{:03d}_{}.prof".format(_state.n_profiles, stage_name)))
+
+    if frame is not None:
+        rows_out, cols_out = _shape(getattr(args[0], frame, None))
+    else:
+        rows_out, cols_out = _shape(result)
+    record = {
+        "event": "stage",
+        "stage": stage_name,
+        "parent": parent,
+        "wall_s": wall,
+        "cpu_s": cpu,
+        "child_cpu_s": child_cpu
+    }
+    record.update(memory)
+    record.update({
+        "rows_in": rows_in,
+        "cols_in": cols_in,
+        "rows_out": rows_out,
+        "cols_out": cols_out
+    })
+    _emit(record)
+    return result
+
+def timed_loop(name, iterable):
+    """
+    Iterate over iterable, recording the number of iterations and the total,
+    mean and max time spent per iteration once the loop finishes. An
+    iteration's time covers producing the item and running the loop body.
+    """
+    if not _state.enabled:
+        return iterable
+    return _timed_iter(name, iterable)
+
+def _timed_iter(name, iterable):
+    times = []
+    parent = _state.stack[-1] if _state.stack else None
+    items = iter(iterable)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                break
+            yield item
+            times.append(time.perf_counter() - start)
+    finally:
+        total = sum(times)
+        _emit({
+            "event": "loop",
+            "loop": name,
+            "parent": parent,
+            "iterations": len(times),
+            "total_s": total,
+            "mean_s": total / len(times) if times else None,
+            "max_s": max(times) if times else None
+        })
+
+if os.environ.get(globs.ENV_LOG) or os.environ.get(globs.ENV_PROFILE_DIR):
+    enable(os.environ.get(globs.ENV_LOG), os.environ.get(globs.ENV_PROFILE_DIR))
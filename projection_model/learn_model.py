@@ -1,12 +1,13 @@
 import pandas as pd
+import numpy as np
 import os
+import sys
 import operator
+import importlib
+from concurrent.futures import ProcessPoolExecutor
 import sklearn.metrics as metrics
-import sklearn.linear_model as lin
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.preprocessing import StandardScaler
 from pprint import pprint
-import matplotlib
 from math import exp
 from numpy import mean
 from numpy import std
@@ -14,9 +15,17 @@ from sklearn.utils import shuffle
 from sklearn.model_selection import cross_val_score
 from sklearn.model_selection import KFold, TimeSeriesSplit
 from sklearn.model_selection import GridSearchCV
+from sklearn.base import clone
+import instrument
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_DIR)
+import worker_pool
+
+DATA_DIR = os.path.join(REPO_DIR, "data")
 
 class globs():
-    dir_in = "../data/model_data/"
+    dir_in = os.path.join(DATA_DIR, "model_data")
 
     file_train = "df_train.csv"
     file_val = "df_val.csv"
@@ -25,6 +34,11 @@ class globs():
     RESPONSE_VAR = "target"
     BENCHMARK = "benchmark"
     SPARE_POS = "TE" # This feature is redundant to [QB, RB, WR]
+    META_VARS = ["year"] # Exported for sorting, not used as features
+    POSITIONS = ["QB", "RB", "WR", "TE"]
+
+    BY_POSITION = False # Train one model per position instead of one for all
+    N_JOBS = len(POSITIONS) # Worker processes for per-position training
 
     grid_params = {
         "GradBoost": {
@@ -38,16 +52,26 @@ class globs():
         }
     }
 
+    # Estimator classes by import path, so their modules load only when a model is fit
     models = {
-        "GradBoost": GradientBoostingRegressor(),
-        #"RandForest": RandomForestRegressor()
+        "GradBoost": "sklearn.ensemble.GradientBoostingRegressor",
+        #"RandForest": "sklearn.ensemble.RandomForestRegressor"
     }
 
+def make_model(name):
+    """New, unfitted estimator for a globs.models entry (an import path or an estimator)."""
+    model = globs.models[name]
+    if not isinstance(model, str):
+        return clone(model)
+    module, cls = model.rsplit(".", 1)
+    return getattr(importlib.import_module(module), cls)()
+
 
 class ModelRun():
     def __init__(self):
         pass
 
+    @instrument.stage(frame="df_train")
     def read_data(self, file_train, file_val, file_test):
         self.df_train = pd.read_csv(file_train).dropna().sort_values(by=["year","target_week"])
         self.df_val = pd.read_csv(file_val).dropna().sort_values(by=["year","target_week"])
@@ -57,8 +81,11 @@ class ModelRun():
         self.features.remove(globs.RESPONSE_VAR)
         self.features.remove(globs.BENCHMARK)
         self.features.remove(globs.SPARE_POS)
+        for col in globs.META_VARS:
+            self.features.remove(col)
 
 
+    @instrument.stage(frame="X_train")
     def prep_data(self):
         ss = StandardScaler()
 
@@ -74,10 +101,11 @@ class ModelRun():
         self.y_test = self.df_test.loc[:,globs.RESPONSE_VAR]
         self.X_test = ss.fit_transform(self.X_test)
 
+    @instrument.stage(frame="X_train")
     def search_models(self):
         self.searches = {}
-        for model in globs.models.keys():
-            regressor = globs.models[model]
+        for model in instrument.timed_loop("search_models.models", globs.models.keys()):
+            regressor = make_model(model)
             search = GridSearchCV(
                 estimator = regressor,
                 param_grid = globs.grid_params[model],
@@ -93,6 +121,7 @@ class ModelRun():
             print("{} Best RMSE: {:.3f}, Params: {}".format(model, best_rmse, best_params))
             self.searches[model] = search
 
+    @instrument.stage(frame="X_val")
     def select_model(self):
         models = {}
         for model, search in self.searches.items():
@@ -108,6 +137,7 @@ class ModelRun():
             "params": self.searches[best_model_class].best_params_
         }
 
+    @instrument.stage(frame="df_test")
     def test_model(self):
         # Fit selected model on Train and Val Combined Data
         df = pd.concat([self.df_train, self.df_val], axis=0)
@@ -129,14 +159,143 @@ class ModelRun():
         rmse_bench = mse_bench**(0.5)
         print("Benchmark RMSE: {:.3f}".format(rmse_bench))
 
-if __name__ == "__main__":
-    modelrun = ModelRun()
+def position_rows(df, positions):
+    """
+    Map each position to the row numbers of df holding that position's players,
+    read from the one-hot position columns.
+    """
+    return {pos: np.flatnonzero(df[pos].to_numpy() == 1) for pos in positions}
+
+def fit_position(pos):
+    """
+    Grid search each model class on one position's training rows, select the
+    class with the lowest validation RMSE and refit it on train + val. Runs in
+    a worker process and returns (pos, model info, fitted model).
+    """
+    shared = worker_pool.shared
+    rows_train = shared["rows_train"][pos]
+    rows_val = shared["rows_val"][pos]
+    X_train, y_train = shared["X_train"][rows_train], shared["y_train"][rows_train]
+    X_val, y_val = shared["X_val"][rows_val], shared["y_val"][rows_val]
+
+    searches = {}
+    val_rmse = {}
+    for model in globs.models.keys():
+        search = GridSearchCV(
+            estimator = make_model(model),
+            param_grid = globs.grid_params[model],
+            scoring="neg_mean_squared_error",
+            cv=TimeSeriesSplit(n_splits=5),
+            refit=True,
+            n_jobs=1
+        )
+        search.fit(X_train, y_train)
+        searches[model] = search
+        val_rmse[model] = metrics.mean_squared_error(y_val, search.predict(X_val))**(0.5)
+    best_model_class = min(val_rmse.items(), key=operator.itemgetter(1))[0]
+    best_search = searches[best_model_class]
+
+    fit_model = clone(best_search.best_estimator_).fit(
+        np.concatenate([X_train, X_val]),
+        np.concatenate([y_train, y_val])
+    )
+    info = {
+        "class": best_model_class,
+        "params": best_search.best_params_,
+        "cv_rmse": (-best_search.best_score_)**(0.5),
+        "val_rmse": val_rmse[best_model_class],
+        "n_train": len(rows_train)
+    }
+    return pos, info, fit_model
+
+class PositionModelRun(ModelRun):
+    """
+    Trains a separate model for each position. The position datasets are row
+    numbers into the train/val/test frames read by read_data() rather than
+    copies of them, and the position models are fit concurrently in a process
+    pool, so a run takes about as long as the slowest position. Features are
+    left unscaled, as in test_model(); the tree ensembles do not need it.
+    """
+    @instrument.stage(frame="df_train")
+    def index_positions(self):
+        self.rows_train = position_rows(self.df_train, globs.POSITIONS)
+        self.rows_val = position_rows(self.df_val, globs.POSITIONS)
+
+    @instrument.stage(frame="df_train")
+    def fit_positions(self, n_jobs=globs.N_JOBS):
+        # Handed to the workers once rather than copied per position
+        shared = {
+            "X_train": self.df_train.loc[:,self.features].to_numpy(),
+            "y_train": self.df_train.loc[:,globs.RESPONSE_VAR].to_numpy(),
+            "X_val": self.df_val.loc[:,self.features].to_numpy(),
+            "y_val": self.df_val.loc[:,globs.RESPONSE_VAR].to_numpy(),
+            "rows_train": self.rows_train,
+            "rows_val": self.rows_val
+        }
+        self.position_models = {}
+        self.position_info = {}
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            mp_context=worker_pool.pool_context(),
+            initializer=worker_pool.init_worker,
+            initargs=(shared,)
+        ) as pool:
+            positions = instrument.timed_loop("fit_positions.positions", pool.map(fit_position, globs.POSITIONS))
+            for pos, info, model in positions:
+                print("{} {} CV RMSE: {:.3f}, Val RMSE: {:.3f}, Params: {}".format(
+                    pos, info["class"], info["cv_rmse"], info["val_rmse"], info["params"]))
+                self.position_models[pos] = model
+                self.position_info[pos] = info
+
+    def predict(self, df):
+        """
+        Predict all rows of df in one batch, routing each player to their
+        position's model. Returns predictions in the row order of df.
+        """
+        X = df.loc[:,self.features].to_numpy()
+        y_pred = np.full(len(df), np.nan)
+        for pos, rows in position_rows(df, self.position_models).items():
+            if len(rows) > 0:
+                y_pred[rows] = self.position_models[pos].predict(X[rows])
+        return y_pred
+
+    @instrument.stage(frame="df_test")
+    def test_model(self):
+        y_test = self.df_test.loc[:,globs.RESPONSE_VAR].to_numpy()
+        y_bench = self.df_test.loc[:,globs.BENCHMARK].to_numpy()
+        y_pred = self.predict(self.df_test)
+
+        for pos, rows in position_rows(self.df_test, self.position_models).items():
+            if len(rows) > 0:
+                rmse = metrics.mean_squared_error(y_test[rows], y_pred[rows])**(0.5)
+                print("{} Test RMSE: {:.3f}".format(pos, rmse))
+        mse = metrics.mean_squared_error(y_test, y_pred)
+        rmse = mse**(0.5)
+        print("By-Position Test RMSE: {:.3f}".format(rmse))
+        mse_bench = metrics.mean_squared_error(y_test, y_bench)
+        rmse_bench = mse_bench**(0.5)
+        print("Benchmark RMSE: {:.3f}".format(rmse_bench))
+
+def run_models(by_position=globs.BY_POSITION):
+    """Read the exported datasets, fit and select models and print test results."""
+    if by_position:
+        modelrun = PositionModelRun()
+    else:
+        modelrun = ModelRun()
     modelrun.read_data(
         os.path.join(globs.dir_in, globs.file_train),
         os.path.join(globs.dir_in, globs.file_val),
         os.path.join(globs.dir_in, globs.file_test)
     )
-    modelrun.prep_data()
-    modelrun.search_models()
-    modelrun.select_model()
+    if by_position:
+        modelrun.index_positions()
+        modelrun.fit_positions()
+    else:
+        modelrun.prep_data()
+        modelrun.search_models()
+        modelrun.select_model()
     modelrun.test_model()
+    return modelrun
+
+if __name__ == "__main__":
+    run_models()
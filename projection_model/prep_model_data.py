@@ -14,23 +14,28 @@ import pickle
 import os
 import re
 import numpy as np
-import matplotlib.pyplot as plt
 from datetime import datetime
 import gc
 import fnmatch
+import instrument
+
+# Paths are relative to the repository, not the working directory
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(REPO_DIR, "data")
+META_DIR = os.path.join(REPO_DIR, "meta_data")
 
 class globs():
-    dir_player = "../data/player_weeks/"
-    dir_opp = "../data/opp_weeks/"
-    dir_salaries = "../data/fanduel_salaries/"
-    dir_nflweather = "../data/nfl_weather/"
-    dir_snapcounts = "../data/snapcounts/"
-    #dir_benchmark = "../data/fanduel_projections/" # TODO: need to get the scraper run for 2019 fanduel projections
-    dir_benchmark = "../data/espn_projections/" # ESPN's PPR projections (only rostered players)
-    dir_model = "../data/model_data/"
-
-    file_team_rename_map = "../meta_data/team_rename_map.csv"
-    file_weather_rename_map = "../meta_data/weather_team_rename_map.csv"
+    dir_player = os.path.join(DATA_DIR, "player_weeks")
+    dir_opp = os.path.join(DATA_DIR, "opp_weeks")
+    dir_salaries = os.path.join(DATA_DIR, "fanduel_salaries")
+    dir_nflweather = os.path.join(DATA_DIR, "nfl_weather")
+    dir_snapcounts = os.path.join(DATA_DIR, "snapcounts")
+    #dir_benchmark = os.path.join(DATA_DIR, "fanduel_projections") # TODO: need to get the scraper run for 2019 fanduel projections
+    dir_benchmark = os.path.join(DATA_DIR, "espn_projections") # ESPN's PPR projections (only rostered players)
+    dir_model = os.path.join(DATA_DIR, "model_data")
+
+    file_team_rename_map = os.path.join(META_DIR, "team_rename_map.csv")
+    file_weather_rename_map = os.path.join(META_DIR, "weather_team_rename_map.csv")
 
     file_opp = "opp_stats_{}.csv"
     file_player = "player_stats_{}.csv"
@@ -75,6 +80,7 @@ def trim_sort(df):
     df = df[globs.stat_cols+['id','week','team','position','full_name']]
     return df
 
+@instrument.stage()
 def get_trend(df_in):
     """Compute a three-week trend for each game statistic, for each player."""
     # Drop non-ID identifier columns
@@ -97,10 +103,11 @@ def get_trend(df_in):
         trend_df[name] = trend_df[['chg_'+col,'per2_chg_'+col,'per3_chg_'+col]].mean(axis=1).fillna(0)
     return trend_df
 
+@instrument.stage()
 def get_cumul_mean_stats(df, weeks):
     """Create a rolling mean for each statistic by player, by week."""
     weeks_stats_mean = []
-    for week in weeks:
+    for week in instrument.timed_loop("get_cumul_mean_stats.weeks", weeks):
         tmp = df[df.week <= week]
         tmp = tmp.groupby(['id'])[globs.stat_cols].mean().reset_index()
         tmp = tmp.add_suffix('_mean')
@@ -110,10 +117,11 @@ def get_cumul_mean_stats(df, weeks):
     cumavg_stats = cumavg_stats.rename(columns={'id_mean':'id'})
     return cumavg_stats
 
+@instrument.stage()
 def get_cumul_stats_time_weighted(df, weeks):
     """Create a rolling time-wegihted mean for each statistic by player, by week."""
     weeks_stats_mean_wgt = []
-    for week in weeks:
+    for week in instrument.timed_loop("get_cumul_stats_time_weighted.weeks", weeks):
         tmp1 = df[df.week <= week]
         mult = lambda x: np.asarray(x) * np.asarray(tmp1.week)
         tmp = tmp1[['id']+globs.stat_cols].set_index('id').apply(mult).reset_index()
@@ -125,6 +133,7 @@ def get_cumul_stats_time_weighted(df, weeks):
     cumavg_stats_wgt = cumavg_stats_wgt.rename(columns={'id_wgtmean':'id'})
     return cumavg_stats_wgt
 
+@instrument.stage()
 def defensive_ptsallow(matchups, weeks, weighted=False):
     """
     Compute the mean weekly points given up by each defense to each position.
@@ -142,7 +151,7 @@ def defensive_ptsallow(matchups, weeks, weighted=False):
         output_name = 'defensive_matchup_allowed_wgt'
     # compute weekly cumulative mean points allowed by each defense
     defense_ranks_dfs = []
-    for week in weeks:
+    for week in instrument.timed_loop("defensive_ptsallow.weeks", weeks):
         matchweek = matchups[matchups.week <= week]
         # weekly sum of pts allowed by a given defense to each position
         weekly_sums = matchweek.groupby(['week','defense','position'])[agg_col].sum().reset_index()
@@ -154,12 +163,13 @@ def defensive_ptsallow(matchups, weeks, weighted=False):
     defense_ranks = pd.concat(defense_ranks_dfs)
     return defense_ranks
 
+@instrument.stage()
 def weekly_player_weights(matchups, weeks):
     """
     Calculate season-to-date (STD) weekly fantasy points rankings by position.
     """
     player_weights = []
-    for week in weeks:
+    for week in instrument.timed_loop("weekly_player_weights.weeks", weeks):
         mask = (matchups.week <= week)
         # each player's mean fantasy points STD
         std_mean = matchups[mask][['id','team','position','fantasy_points','defense']]
@@ -197,6 +207,7 @@ class WeeklyStatsYear():
         self.fpath_snapcounts = fpath_snapcounts
         self.dir_nflweather = dir_nflweather
 
+    @instrument.stage(frame="df_player")
     def read_player_data(self, filepath):
         self.df_player = pd.read_csv(filepath)
         team_rename_map = RenameMap(globs.file_team_rename_map).rename_map
@@ -206,6 +217,7 @@ class WeeklyStatsYear():
         self.df_player = self.df_player.rename(columns={"name": "full_name"})
         self.df_player = self.df_player.reset_index()
 
+    @instrument.stage(frame="df_opp")
     def read_opp_data(self, filepath):
         self.df_opp = pd.read_csv(filepath)
         team_rename_map = RenameMap(globs.file_team_rename_map).rename_map
@@ -235,6 +247,7 @@ class WeeklyStatsYear():
         }
         self.df_opp = self.df_opp.rename(columns=opp_cols_rename_dict)
 
+    @instrument.stage(frame="df_player")
     def calc_target(self):
         """
         Create fantasy_points (the target variable) according to a
@@ -254,6 +267,7 @@ class WeeklyStatsYear():
         (self.df_player['puntret_tds'] * 6) +\
         (self.df_player['fumbles_lost'] * -2)
 
+    @instrument.stage(frame="df_player")
     def calc_target_PPR(self):
         """
         Create fantasy_poiints (the target variable) according to a PPR scoring
@@ -283,6 +297,7 @@ class WeeklyStatsYear():
         """
         pass
 
+    @instrument.stage(frame="df_player")
     def calc_ratios(self):
         """
         Create pass/rus/reception ratios to be included in feature set for model.
@@ -295,6 +310,7 @@ class WeeklyStatsYear():
         self.df_player['RushRecRatio_Tds'] = self.df_player['rushing_tds'] / self.df_player['receiving_tds']
         self.df_player['RushRecRatio_Yds'] = self.df_player['rushing_yds'] / self.df_player['receiving_yds']
 
+    @instrument.stage(frame="df_player")
     def clean_positions(self):
         """
         Trim the dataset to include the four main offensive positions: QB, RB, WR, TE
@@ -323,6 +339,7 @@ class WeeklyStatsYear():
     # Feature Engineering Helper Functions
 
 
+    @instrument.stage(frame="df_model", frame_in="df_player")
     def create_nfl_features(self):
 
         """Wrapper function that calls all helpers to create custom player and team
@@ -401,6 +418,7 @@ class WeeklyStatsYear():
         self.df_model["year"] = self.year # For some reason 'year' gets dropped in this function
         return self.df_model
 
+    @instrument.stage(frame="df_salaries")
     def read_salaries_data(self, filepath):
         self.df_salaries = pd.read_csv(filepath)
         self.df_salaries['FirstName'] = self.df_salaries['FirstName'].str.strip()
@@ -416,16 +434,20 @@ class WeeklyStatsYear():
         team_rename_map = RenameMap(globs.file_team_rename_map).rename_map
         self.df_salaries["team"] = self.df_salaries["team"].replace(team_rename_map)
 
+    @instrument.stage(frame="df_model")
     def merge_salaries(self):
         self.df_model = self.df_model.merge(self.df_salaries, on=["week","full_name","team"], how="left")
         self.df_model = self.df_model.fillna(0)
 
+    @instrument.stage(frame="df_snapcounts")
     def read_snapcounts_data(self, filepath):
         self.df_snapcounts = pd.read_csv(filepath)
 
+    @instrument.stage(frame="df_model")
     def merge_snapcounts(self):
         self.df_model = self.df_model.merge(self.df_snapcounts, on=["full_name", "week", "year"], how="left")
 
+    @instrument.stage(frame="df_weather")
     def read_weather_data(self, dir_nflweather):
         team_rename_map = RenameMap(globs.file_weather_rename_map).rename_map
         weather_files = os.listdir(dir_nflweather)
@@ -453,23 +475,36 @@ class WeeklyStatsYear():
         weather2.columns = ['team','wind_conditions','indoor_outdoor','week','year']
         self.df_weather = pd.concat([weather1,weather2])
 
+    @instrument.stage(frame="df_model")
     def merge_weather(self):
         self.df_model = self.df_model.merge(self.df_weather, on=["team", "week", "year"], how="left")
 
-    def prep_model_data(self):
+    @instrument.stage(frame="df_model")
+    def prep_features(self):
+        """Player and opponent stats through create_nfl_features(). Needs no salary or weather data."""
         self.read_player_data(self.fpath_player)
         self.read_opp_data(self.fpath_opp)
-        self.read_salaries_data(self.fpath_salaries)
         self.calc_target_PPR()
         self.calc_ratios()
         self.clean_positions()
         self.create_nfl_features()
+
+    @instrument.stage(frame="df_model")
+    def merge_inputs(self):
+        """Merge the salary and weather data read by read_salaries_data() and read_weather_data()."""
         self.merge_salaries()
         # self.read_snapcounts_data(self.fpath_snapcounts)
         # self.merge_snapcounts()
-        self.read_weather_data(self.dir_nflweather)
         self.merge_weather()
 
+    @instrument.stage(frame="df_model")
+    def prep_model_data(self):
+        self.read_salaries_data(self.fpath_salaries)
+        self.prep_features()
+        self.read_weather_data(self.dir_nflweather)
+        self.merge_inputs()
+
+    @instrument.stage(frame="df_model")
     def export_model_data(self):
         savepath = os.path.join(globs.dir_model, globs.file_model_data.format(self.year))
         self.df_model.to_csv(savepath, index=False)
@@ -502,6 +537,7 @@ class MLDataset():
         self.val_yrs = val_yrs
         self.test_yrs = test_yrs
 
+    @instrument.stage(frame="df_train")
     def split_train_val_test(self):
         self.df_train = [data_yr.df_model for data_yr in self.all_data if data_yr.year in self.train_yrs]
         self.df_train = pd.concat(self.df_train)
@@ -512,11 +548,13 @@ class MLDataset():
         self.df_test = [data_yr.df_model for data_yr in self.all_data if data_yr.year in self.test_yrs]
         self.df_test = pd.concat(self.df_test)
 
+    @instrument.stage(frame="df_train")
     def subset_position(self):
         self.df_train = self.df_train[self.df_train[self.pos]==1]
         self.df_val = self.df_val[self.df_val[self.pos]==1]
         self.df_test = self.df_test[self.df_test[self.pos]==1]
 
+    @instrument.stage(frame="df_test")
     def read_espn_benchmark(self, filepath):
         df = pd.read_csv(filepath)
         rename_dict = {
@@ -538,11 +576,13 @@ class MLDataset():
     def read_fantasydata_benchmark(self, filepath):
         pass
 
+    @instrument.stage(frame="df_train")
     def trim_low_scores(self):
         self.df_train = self.df_train[self.df_train.target > 0]
         self.df_val = self.df_val[self.df_val.target > 0]
         self.df_test = self.df_test[self.df_test.target > 0]
 
+    @instrument.stage(frame="df_train")
     def get_all_features(self):
         qb_features = [c for c in self.df_train if fnmatch.fnmatch(c, "passing*_wgt*mean")]
         qb_features += [c for c in self.df_train if fnmatch.fnmatch(c, "passer*_wgt*mean")]
@@ -562,11 +602,13 @@ class MLDataset():
 
         target_col = ["target"]
         benchmark_col = ["benchmark"]
+        meta_col = ["year"] # Not a feature; learn_model.py sorts on it
 
-        self.df_train = self.df_train[self.all_features + target_col]
-        self.df_val = self.df_val[self.all_features + target_col]
-        self.df_test = self.df_test[self.all_features + target_col + benchmark_col]
+        self.df_train = self.df_train[self.all_features + target_col + meta_col]
+        self.df_val = self.df_val[self.all_features + target_col + meta_col]
+        self.df_test = self.df_test[self.all_features + target_col + benchmark_col + meta_col]
 
+    @instrument.stage(frame="df_train")
     def export_datasets(self):
         # Print export datsets sizes
         print("Train Shape: {}".format(self.df_train.shape))
@@ -583,6 +625,22 @@ class MLDataset():
         self.df_val.to_csv(savepath_val, index=False)
         self.df_test.to_csv(savepath_test, index=False)
 
+def prep_datasets(stats_yrs):
+    """Split prepared years into train/val/test sets, add the benchmark and export them."""
+    ml_dataset = MLDataset(
+        stats_yrs,
+        "all",
+        globs.TRAIN_YRS,
+        globs.VAL_YRS,
+        globs.TEST_YRS
+    )
+    ml_dataset.split_train_val_test()
+    ml_dataset.read_espn_benchmark(os.path.join(globs.dir_benchmark, globs.file_benchmark))
+    ml_dataset.trim_low_scores()
+    ml_dataset.get_all_features()
+    ml_dataset.export_datasets()
+    return ml_dataset
+
 if __name__ == "__main__":
     # Prep Yearly Stats
     stats_yrs = []
@@ -596,37 +654,14 @@ if __name__ == "__main__":
             os.path.join(globs.dir_snapcounts, globs.file_snapcounts.format(year)),
             globs.dir_nflweather
         )
-        stats_yr.prep_model_data()
-        stats_yr.export_model_data()
+        with instrument.context(year=year):
+            stats_yr.prep_model_data()
+            stats_yr.export_model_data()
         stats_yrs.append(stats_yr)
 
     # Prep Train/Val/Test Splits
-    ml_dataset = MLDataset(
-        stats_yrs,
-        "all",
-        globs.TRAIN_YRS,
-        globs.VAL_YRS,
-        globs.TEST_YRS
-    )
-    ml_dataset.split_train_val_test()
-    ml_dataset.read_espn_benchmark(os.path.join(globs.dir_benchmark, globs.file_benchmark))
-    ml_dataset.trim_low_scores()
-    ml_dataset.get_all_features()
-    ml_dataset.export_datasets()
+    prep_datasets(stats_yrs)
 
-    '''
-    ml_datasets = {}
-    for pos in globs.INCLUDE_POSITIONS:
-        print("Generating ML Datasets by Position: {}".format(pos))
-        ml_datasets[pos] = MLDataset(
-            stats_yrs,
-            pos,
-            globs.TRAIN_YRS,
-            globs.VAL_YRS,
-            globs.TEST_YRS
-        )
-        ml_datasets[pos].split_train_val_test()
-        ml_datasets[pos].subset_position()
-        ml_datasets[pos].read_espn_benchmark(os.path.join(globs.dir_benchmark, globs.file_benchmark))
-        ml_datasets[pos].get_all_features()
-    '''
+    # Per-position datasets are not exported separately. learn_model.py's
+    # PositionModelRun indexes each position's rows in these shared splits
+    # through the QB/RB/WR/TE columns (set globs.BY_POSITION there).
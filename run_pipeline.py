@@ -0,0 +1,494 @@
+"""
+Pipeline runner. Runs the steps of the workflow as a graph of stages:
+
+    scrape (only with --scrape)
+      -> salaries_<year> ----------------------------.
+    weather_<year> --------------------------------- model_data_<year> -> datasets -> learn_model
+    features_<year> (player + opponent stats) -----'
+    salaries file + projections file (--projections) -> optimizer
+    salaries file -> hindsight_lineups
+
+The optimizer stage builds lineups from a projections CSV (full_name, proj)
+and only exists when one is given. hindsight_lineups projects every player at
+the points they actually scored, so its lineups are the best that could have
+been picked in hindsight: a benchmark for the optimizer's lineups, not a
+forecast. It only runs when named.
+
+Stages whose dependencies are done run concurrently in worker processes, so
+the weather, salary and feature stages of every season run side by side.
+
+A stage is re-run only when it is out of date: it has never run, one of its
+outputs is missing or was changed since it was written, its parameters
+changed, or one of its input files (data, upstream outputs, or the code of the
+script it runs and of the repository modules that script imports) changed. Files are checked by modification time and size first
+and hashed only when those differ, so touching a file without changing it does
+not re-run anything.
+Stamps are kept in <data dir>/pipeline/stamps.json.
+
+The runner itself only imports the standard library. pandas, sklearn and the
+pipeline scripts are imported by a stage's worker when the stage runs, so
+--help, --list and runs with nothing to do start immediately.
+
+Usage:
+    python run_pipeline.py                       # everything up to learn_model
+    python run_pipeline.py --projections proj_week16.csv   # ... and the optimizer
+    python run_pipeline.py hindsight_lineups     # hindsight-optimal benchmark lineups
+    python run_pipeline.py features datasets     # named stages or groups, plus what they need
+    python run_pipeline.py --dry-run             # show what would run and why
+    python run_pipeline.py --scrape --years 2017 2018 2019
+"""
+
+import os
+import sys
+import ast
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import worker_pool
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+CODE_DIRS = ["projection_model", "lineup_optimizer", "scraper"]
+
+class globs():
+    dir_data = os.path.join(REPO_DIR, "data")
+    dir_meta = os.path.join(REPO_DIR, "meta_data")
+    dir_work = "pipeline" # Intermediate per-season frames and stamps, under the data dir
+    dir_model = "model_data"
+    dir_lineups = "lineups"
+    file_stamps = "stamps.json"
+
+    # Same seasons as prep_model_data.globs.YEARS. The last season is the
+    # test set, the one before it validation and the rest training.
+    YEARS = [2016, 2017, 2018, 2019]
+    WEEK = 16 # Optimizer slate week of the last season
+    N_LINEUPS = 20
+    DEFAULT_TARGETS = ["learn_model"] # Plus optimizer when --projections is given
+
+    code = {
+        "prep": os.path.join(REPO_DIR, "projection_model", "prep_model_data.py"),
+        "learn": os.path.join(REPO_DIR, "projection_model", "learn_model.py"),
+        "optimizer": os.path.join(REPO_DIR, "lineup_optimizer", "lineup_optimizer.py"),
+        "slate": os.path.join(REPO_DIR, "lineup_optimizer", "optimizer_service.py"),
+        "scrape": os.path.join(REPO_DIR, "scraper", "scrape_dfs_salary.py")
+    }
+
+# Stage functions. These run in worker processes and do their own imports.
+
+def _prep_module(cfg):
+    """Import prep_model_data and point its globs at the configured directories."""
+    for d in CODE_DIRS:
+        path = os.path.join(REPO_DIR, d)
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    import prep_model_data
+    g = prep_model_data.globs
+    g.dir_player = os.path.join(cfg["data"], "player_weeks")
+    g.dir_opp = os.path.join(cfg["data"], "opp_weeks")
+    g.dir_salaries = os.path.join(cfg["data"], "fanduel_salaries")
+    g.dir_nflweather = os.path.join(cfg["data"], "nfl_weather")
+    g.dir_snapcounts = os.path.join(cfg["data"], "snapcounts")
+    g.dir_benchmark = os.path.join(cfg["data"], "espn_projections")
+    g.dir_model = os.path.join(cfg["data"], globs.dir_model)
+    g.file_team_rename_map = os.path.join(cfg["meta"], "team_rename_map.csv")
+    g.file_weather_rename_map = os.path.join(cfg["meta"], "weather_team_rename_map.csv")
+    years = cfg["years"]
+    g.YEARS = list(years)
+    g.TRAIN_YRS = list(years[:-2])
+    g.VAL_YRS = [years[-2]]
+    g.TEST_YRS = [years[-1]]
+    g.file_benchmark = "espn_proj_{}.csv".format(years[-1])
+    return prep_model_data
+
+def _stats_year(pmd, year):
+    g = pmd.globs
+    return pmd.WeeklyStatsYear(
+        year,
+        os.path.join(g.dir_player, g.file_player.format(year)),
+        os.path.join(g.dir_opp, g.file_opp.format(year)),
+        os.path.join(g.dir_salaries, g.file_salaries.format(year)),
+        os.path.join(g.dir_snapcounts, g.file_snapcounts.format(year)),
+        g.dir_nflweather
+    )
+
+def run_scrape(cfg, years):
+    _prep_module(cfg)
+    import scrape_dfs_salary
+    scrape_dfs_salary.scrape_salaries(years, os.path.join(cfg["data"], "fanduel_salaries"))
+
+def run_weather(cfg, year, out):
+    stats_yr = _stats_year(_prep_module(cfg), year)
+    stats_yr.read_weather_data(stats_yr.dir_nflweather)
+    stats_yr.df_weather.to_pickle(out)
+
+def run_salaries(cfg, year, out):
+    stats_yr = _stats_year(_prep_module(cfg), year)
+    stats_yr.read_salaries_data(stats_yr.fpath_salaries)
+    stats_yr.df_salaries.to_pickle(out)
+
+def run_features(cfg, year, out):
+    stats_yr = _stats_year(_prep_module(cfg), year)
+    stats_yr.prep_features()
+    stats_yr.df_model.to_pickle(out)
+
+def run_model_data(cfg, year, features, salaries, weather):
+    import pandas as pd
+    stats_yr = _stats_year(_prep_module(cfg), year)
+    stats_yr.df_model = pd.read_pickle(features)
+    stats_yr.df_salaries = pd.read_pickle(salaries)
+    stats_yr.df_weather = pd.read_pickle(weather)
+    stats_yr.merge_inputs()
+    stats_yr.export_model_data()
+
+def run_datasets(cfg, model_files):
+    import pandas as pd
+    pmd = _prep_module(cfg)
+    stats_yrs = []
+    for year, path in zip(cfg["years"], model_files):
+        stats_yr = _stats_year(pmd, year)
+        stats_yr.df_model = pd.read_csv(path)
+        stats_yrs.append(stats_yr)
+    pmd.prep_datasets(stats_yrs)
+
+def run_learn_model(cfg, out):
+    _prep_module(cfg)
+    import learn_model
+    learn_model.globs.dir_in = os.path.join(cfg["data"], globs.dir_model)
+    modelrun = learn_model.run_models()
+    info = getattr(modelrun, "position_info", None) or modelrun.best_model_info
+    with open(out, "w") as f:
+        json.dump(info, f, indent=2, default=str)
+
+def run_optimizer(cfg, salaries, week, n_lineups, out, projections=None):
+    """Lineups for the week. Without projections, players are projected at their actual fd_points."""
+    _prep_module(cfg)
+    import lineup_optimizer
+    import optimizer_service
+    pool = optimizer_service.load_slate(salaries, week, projections)
+    lineups = lineup_optimizer.optimize_lineups(pool, n_lineups, seed=0)
+    lineup_optimizer.lineups_frame(pool, lineups).to_csv(out)
+
+# Graph
+
+def code_inputs(*scripts):
+    """
+    The scripts plus every repository module they import, directly or through
+    other repository modules, found by parsing their import statements.
+    A module resolves to <name>.py in the importing script's directory, a
+    CODE_DIRS directory or the repository root, as on the scripts' sys.path.
+    """
+    dirs = [os.path.join(REPO_DIR, d) for d in CODE_DIRS] + [REPO_DIR]
+    found = set()
+    todo = list(scripts)
+    while todo:
+        path = todo.pop()
+        if path in found:
+            continue
+        found.add(path)
+        with open(path) as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                for d in [os.path.dirname(path)] + dirs:
+                    module = os.path.join(d, name.split(".")[0] + ".py")
+                    if os.path.exists(module):
+                        todo.append(module)
+                        break
+    return sorted(found)
+
+class Stage():
+    """
+    One step of the pipeline. inputs are files read by the stage (its
+    dependencies' outputs are added to them); params are values that re-run
+    the stage when they change.
+    """
+    def __init__(self, name, func, args, inputs=(), outputs=(), deps=(), params=None):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.params = params or {}
+
+def build_graph(cfg, scrape=False, week=globs.WEEK, n_lineups=globs.N_LINEUPS, projections=None):
+    """Stages for the configured seasons, by name, in a valid run order."""
+    data, meta, years = cfg["data"], cfg["meta"], cfg["years"]
+    work = os.path.join(data, globs.dir_work)
+    model = os.path.join(data, globs.dir_model)
+    team_map = os.path.join(meta, "team_rename_map.csv")
+    weather_map = os.path.join(meta, "weather_team_rename_map.csv")
+    salaries_file = lambda year: os.path.join(data, "fanduel_salaries", "fd_salaries_{}.csv".format(year))
+    # Each script's code inputs include the repository modules it imports (instrument, worker_pool, ...)
+    code = {name: code_inputs(script) for name, script in globs.code.items()}
+    code["slate"] = code_inputs(globs.code["optimizer"], globs.code["slate"])
+
+    stages = []
+    if scrape:
+        stages.append(Stage("scrape", run_scrape, (cfg, years), code["scrape"],
+                             [salaries_file(y) for y in years], params={"years": years}))
+    scrape_dep = ["scrape"] if scrape else []
+
+    for year in years:
+        weather_dir = os.path.join(data, "nfl_weather")
+        weather_files = []
+        if os.path.isdir(weather_dir):
+            weather_files = sorted(os.path.join(weather_dir, fn) for fn in os.listdir(weather_dir)
+                                   if fn.startswith(str(year)))
+        out = {k: os.path.join(work, "{}_{}.pkl".format(k, year)) for k in ["weather", "salaries", "features"]}
+        stages += [
+            Stage("weather_{}".format(year), run_weather, (cfg, year, out["weather"]),
+                  weather_files + [weather_map] + code["prep"], [out["weather"]]),
+            Stage("salaries_{}".format(year), run_salaries, (cfg, year, out["salaries"]),
+                  [salaries_file(year), team_map] + code["prep"], [out["salaries"]], deps=scrape_dep),
+            Stage("features_{}".format(year), run_features, (cfg, year, out["features"]),
+                  [os.path.join(data, "player_weeks", "player_stats_{}.csv".format(year)),
+                   os.path.join(data, "opp_weeks", "opp_stats_{}.csv".format(year)),
+                   team_map] + code["prep"], [out["features"]]),
+            Stage("model_data_{}".format(year), run_model_data,
+                  (cfg, year, out["features"], out["salaries"], out["weather"]), code["prep"],
+                  [os.path.join(model, "df_model_{}.csv".format(year))],
+                  deps=["features_{}".format(year), "salaries_{}".format(year), "weather_{}".format(year)])
+        ]
+
+    lineups_file = lambda kind: os.path.join(data, globs.dir_lineups, "lineups_{}{}_wk{}.csv".format(kind, years[-1], week))
+    optimizer_params = {"week": week, "n_lineups": n_lineups}
+    if projections:
+        stages.append(Stage("optimizer", run_optimizer,
+                            (cfg, salaries_file(years[-1]), week, n_lineups, lineups_file(""), projections),
+                            [salaries_file(years[-1]), projections] + code["slate"],
+                            [lineups_file("")], deps=scrape_dep, params=optimizer_params))
+    stages.append(Stage("hindsight_lineups", run_optimizer,
+                        (cfg, salaries_file(years[-1]), week, n_lineups, lineups_file("hindsight_")),
+                        [salaries_file(years[-1])] + code["slate"],
+                        [lineups_file("hindsight_")], deps=scrape_dep, params=optimizer_params))
+
+    model_files = [os.path.join(model, "df_model_{}.csv".format(y)) for y in years]
+    splits = [os.path.join(model, fn) for fn in ["df_train.csv", "df_val.csv", "df_test.csv"]]
+    stages += [
+        Stage("datasets", run_datasets, (cfg, model_files),
+              [os.path.join(data, "espn_projections", "espn_proj_{}.csv".format(years[-1]))] + code["prep"],
+              splits, deps=["model_data_{}".format(y) for y in years], params={"years": years}),
+        Stage("learn_model", run_learn_model, (cfg, os.path.join(model, "learn_model.json")),
+              code["learn"], [os.path.join(model, "learn_model.json")], deps=["datasets"])
+    ]
+
+    graph = {stage.name: stage for stage in stages}
+    for stage in stages:
+        for dep in stage.deps:
+            stage.inputs += [p for p in graph[dep].outputs if p not in stage.inputs]
+    return graph
+
+def select(graph, targets):
+    """Names of the stages needed for targets (stage names or name prefixes such as "features"), in graph order."""
+    wanted = set()
+    def add(name):
+        if name not in wanted:
+            wanted.add(name)
+            for dep in graph[name].deps:
+                add(dep)
+    for target in targets:
+        matches = [name for name in graph if name == target or name.startswith(target + "_")]
+        if not matches:
+            raise KeyError("Unknown stage: {}".format(target))
+        for name in matches:
+            add(name)
+    return [name for name in graph if name in wanted]
+
+def _show(path):
+    """Path relative to the working directory when it is under it."""
+    rel = os.path.relpath(path)
+    return path if rel.startswith(os.pardir) else rel
+
+# Change detection
+
+def file_digest(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+class Stamps():
+    """Inputs, parameters and outputs recorded for each stage's last successful run."""
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.data = json.load(f)
+
+    def _file_stamp(self, path, old=None):
+        st = os.stat(path)
+        if old is not None and old["mtime_ns"] == st.st_mtime_ns and old["size"] == st.st_size:
+            return old
+        return {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha1": file_digest(path)}
+
+    def out_of_date(self, stage):
+        """Why stage needs to run, or None if it is up to date."""
+        record = self.data.get(stage.name)
+        if record is None:
+            return "never run"
+        if record["params"] != json.loads(json.dumps(stage.params)):
+            return "parameters changed"
+        for path in stage.outputs:
+            if not os.path.exists(path):
+                return "missing output {}".format(_show(path))
+        if sorted(record.get("outputs", {})) != sorted(stage.outputs):
+            return "output files added or removed"
+        if sorted(record["inputs"]) != sorted(stage.inputs):
+            return "input files added or removed"
+        for kind, label in [("outputs", "changed output "), ("inputs", "changed ")]:
+            for path in getattr(stage, kind):
+                old = record[kind][path]
+                new = self._file_stamp(path, old)
+                if new["sha1"] != old["sha1"]:
+                    return label + _show(path)
+                record[kind][path] = new # Same contents, newer mtime: skip hashing next time
+        return None
+
+    def record(self, stage):
+        old = self.data.get(stage.name, {})
+        self.data[stage.name] = {
+            "params": stage.params,
+            "inputs": {path: self._file_stamp(path, old.get("inputs", {}).get(path)) for path in stage.inputs},
+            # Written by this run, so always hashed
+            "outputs": {path: self._file_stamp(path) for path in stage.outputs},
+            "time": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.data, f, indent=1)
+        os.replace(tmp, self.path)
+
+# Scheduling
+
+def _call(func, args):
+    func(*args)
+
+def run(graph, names, stamps, n_jobs=1, force=False, dry_run=False):
+    """
+    Run the named stages in dependency order, n_jobs at a time. Returns the
+    status of each stage: "ran", "up to date", "would run", "failed" or
+    "blocked" (a dependency failed).
+    """
+    status = {}
+    pending = list(names)
+    running = {}
+    workers = None
+    produced = {path for name in names for path in graph[name].outputs}
+    try:
+        while pending or running:
+            for name in list(pending):
+                stage = graph[name]
+                deps = [d for d in stage.deps if d in names]
+                if any(status.get(d) in ("failed", "blocked") for d in deps):
+                    status[name] = "blocked"
+                    pending.remove(name)
+                    print("[blocked] {}".format(name))
+                    continue
+                if not all(d in status for d in deps):
+                    continue
+                pending.remove(name)
+                missing = [p for p in stage.inputs if p not in produced and not os.path.exists(p)]
+                if any(status[d] == "would run" for d in deps):
+                    reason = "dependency would run"
+                elif missing:
+                    status[name] = "failed"
+                    print("[failed] {}: missing input {}".format(name, _show(missing[0])))
+                    continue
+                else:
+                    reason = "forced" if force else stamps.out_of_date(stage)
+                if reason is None:
+                    status[name] = "up to date"
+                    print("[ok]     {}".format(name))
+                elif dry_run:
+                    status[name] = "would run"
+                    print("[run]    {} ({})".format(name, reason))
+                else:
+                    print("[start]  {} ({})".format(name, reason))
+                    for path in stage.outputs:
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                    if workers is None:
+                        workers = ProcessPoolExecutor(max_workers=n_jobs, mp_context=worker_pool.pool_context())
+                    running[workers.submit(_call, stage.func, stage.args)] = (name, time.perf_counter())
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, start = running.pop(future)
+                error = future.exception()
+                if error is None:
+                    status[name] = "ran"
+                    stamps.record(graph[name])
+                    stamps.save()
+                    print("[done]   {} {:.1f}s".format(name, time.perf_counter() - start))
+                else:
+                    status[name] = "failed"
+                    print("[failed] {}: {!r}".format(name, error))
+    finally:
+        if workers is not None:
+            workers.shutdown()
+    if not dry_run:
+        stamps.save() # Keeps refreshed mtimes of unchanged inputs
+    return status
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the pipeline stages that are out of date.")
+    parser.add_argument("targets", nargs="*",
+                        help="stage names or groups (e.g. features, model_data, datasets); "
+                             "default: {}, plus optimizer with --projections".format(" ".join(globs.DEFAULT_TARGETS)))
+    parser.add_argument("--years", type=int, nargs="+", default=globs.YEARS)
+    parser.add_argument("--week", type=int, default=globs.WEEK, help="optimizer week of the last season")
+    parser.add_argument("--n-lineups", type=int, default=globs.N_LINEUPS)
+    parser.add_argument("--projections", help="optimizer projections CSV (full_name, proj) for that week")
+    parser.add_argument("--scrape", action="store_true", help="re-scrape salaries before ingesting them")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="stages run at once")
+    parser.add_argument("--force", action="store_true", help="run the selected stages even if up to date")
+    parser.add_argument("--dry-run", action="store_true", help="show what would run and why")
+    parser.add_argument("--list", action="store_true", help="list the stages and their dependencies")
+    parser.add_argument("--data-dir", default=globs.dir_data)
+    parser.add_argument("--meta-dir", default=globs.dir_meta)
+    args = parser.parse_args(argv)
+
+    if len(args.years) < 3:
+        parser.error("--years needs at least three seasons (train, validation and test)")
+    cfg = {"data": os.path.abspath(args.data_dir), "meta": os.path.abspath(args.meta_dir), "years": args.years}
+    projections = os.path.abspath(args.projections) if args.projections else None
+    graph = build_graph(cfg, args.scrape, args.week, args.n_lineups, projections)
+    targets = args.targets or globs.DEFAULT_TARGETS + (["optimizer"] if projections else [])
+    targets = list(targets) + (["scrape"] if args.scrape else [])
+    try:
+        names = select(graph, targets)
+    except KeyError as e:
+        parser.error(e.args[0])
+
+    if args.list:
+        for name in names:
+            print("{} <- {}".format(name, ", ".join(graph[name].deps) or "-"))
+        return 0
+
+    stamps = Stamps(os.path.join(cfg["data"], globs.dir_work, globs.file_stamps))
+    if args.scrape:
+        stamps.data.pop("scrape", None) # Scraping always fetches fresh data
+    status = run(graph, names, stamps, args.jobs, args.force, args.dry_run)
+    counts = {}
+    for s in status.values():
+        counts[s] = counts.get(s, 0) + 1
+    print(", ".join("{} {}".format(n, s) for s, n in counts.items()))
+    return 1 if any(s in ("failed", "blocked") for s in status.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,4 @@
+import os
 import re
 import requests
 import pandas as pd
@@ -5,27 +6,28 @@ from bs4 import BeautifulSoup
 
 CURR_WEEK = 18
 YEARS = [2017, 2018, 2019]
-PATH = "../data/fanduel_salaries/"
+PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "fanduel_salaries")
 root_url = "http://rotoguru1.com/cgi-bin/fyday.pl?week={}&year={}&game={}&scsv=1"
-urls_by_service = {}
 services = ['fd'] # dk, yh
-for year in YEARS:
-    for service in services:
-        urls = []
-        for week in range(14, CURR_WEEK):
-            urls.append(root_url.format(str(week), str(year),service))
-        urls_by_service[service] = urls
 
-for year in YEARS:
-    for service in services:
-        with open(PATH+service+'_salaries_'+str(year)+'.csv', 'a') as f:
-            header = "Week,Year,GID,FirstName,LastName,Pos,Team,h/a,Oppt,"+service+"_points,"+service+"_salary\n"
-            f.write(header)
-            for url in urls_by_service[service]:
-                page = requests.get(url)
-                soup = BeautifulSoup(page.text)
-                pre_tag_text = soup.find('pre').text
-                csv_text = re.sub(';', ',', pre_tag_text)
-                csv = csv_text.split('\n')[1:]
-                f.write("\n".join(csv))
-            f.close()
+def scrape_salaries(years=YEARS, path=PATH, curr_week=CURR_WEEK):
+    """Write <service>_salaries_<year>.csv to path for weeks 14 to curr_week - 1 of each year."""
+    for year in years:
+        for service in services:
+            urls = []
+            for week in range(14, curr_week):
+                urls.append(root_url.format(str(week), str(year), service))
+            # Overwrite rather than append, so re-running does not duplicate weeks
+            with open(os.path.join(path, service+'_salaries_'+str(year)+'.csv'), 'w') as f:
+                header = "Week,Year,GID,FirstName,LastName,Pos,Team,h/a,Oppt,"+service+"_points,"+service+"_salary\n"
+                f.write(header)
+                for url in urls:
+                    page = requests.get(url)
+                    soup = BeautifulSoup(page.text)
+                    pre_tag_text = soup.find('pre').text
+                    csv_text = re.sub(';', ',', pre_tag_text)
+                    csv = csv_text.split('\n')[1:]
+                    f.write("\n".join(csv))
+
+if __name__ == "__main__":
+    scrape_salaries()
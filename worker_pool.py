@@ -0,0 +1,29 @@
+"""
+Process pool helpers shared by the parallel stages (per-position model fits,
+late swap, contest simulation, pipeline stages). Standard library only, so the
+pipeline runner can import it without pulling in pandas.
+
+Large read-only state (arrays, fitted tables) is handed to the workers once
+through the pool initializer instead of with every task:
+
+    with ProcessPoolExecutor(max_workers=n_jobs, mp_context=worker_pool.pool_context(),
+                             initializer=worker_pool.init_worker, initargs=(state,)) as workers:
+        ...
+
+and task functions read it from worker_pool.shared. With the "fork" start
+method the workers inherit the state from the parent process instead of
+unpickling a copy each.
+"""
+
+import multiprocessing as mp
+
+shared = {}
+
+def init_worker(state):
+    shared.update(state)
+
+def pool_context():
+    """The "fork" context where available (not on Windows), otherwise the default."""
+    if "fork" in mp.get_all_start_methods():
+        return mp.get_context("fork")
+    return mp.get_context()